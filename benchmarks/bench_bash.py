@@ -0,0 +1,57 @@
+"""
+Bash tool latency benchmark: round-trip time of `_BashSession.run` for trivial
+commands, where the tool's own overhead dominates, and for a few large outputs.
+
+    python -m benchmarks.bench_bash --iterations 50
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from tools.bash import _BashSession
+
+TRIVIAL_COMMANDS = ["true", "echo hello", "pwd", "echo error >&2"]
+LARGE_COMMANDS = ["seq 1 100000", "head -c 1000000 /dev/zero | tr '\\0' x"]
+
+
+async def bench(session: _BashSession, command: str, iterations: int) -> dict:
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        result = await session.run(command)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "command": command[:24],
+        "mean_ms": statistics.mean(timings),
+        "p50_ms": timings[len(timings) // 2],
+        "p95_ms": timings[int(len(timings) * 0.95) - 1],
+        "output_kb": len(result.output or "") / 1024,
+    }
+
+
+async def run(iterations: int):
+    session = _BashSession()
+    await session.start()
+    columns = ["command", "mean_ms", "p50_ms", "p95_ms", "output_kb"]
+    print(" ".join(f"{column:>24}" for column in columns))
+    try:
+        for command in TRIVIAL_COMMANDS + LARGE_COMMANDS:
+            row = await bench(session, command, iterations)
+            print(" ".join(f"{row[c]:>24.2f}" if isinstance(row[c], float) else f"{row[c]:>24}" for c in columns))
+    finally:
+        session.stop()
+        await session._process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.iterations))
+
+
+if __name__ == "__main__":
+    main()
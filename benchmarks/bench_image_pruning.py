@@ -0,0 +1,87 @@
+"""
+Micro-benchmark for screenshot pruning over long conversations.
+
+Compares the per-turn cost of the full-rescan `_maybe_filter_to_n_most_recent_images`
+with the incremental `ImageIndex` as a conversation grows to a few thousand turns.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_image_pruning
+"""
+
+import argparse
+import time
+
+from loop import ImageIndex, _maybe_filter_to_n_most_recent_images
+
+FAKE_IMAGE = "A" * 1024
+
+
+def _turn(i: int) -> tuple[dict, dict]:
+    tool_use_id = f"toolu_{i}"
+    assistant = {
+        "role": "assistant",
+        "content": [
+            {"type": "text", "text": f"step {i}"},
+            {"type": "tool_use", "id": tool_use_id, "name": "computer", "input": {}},
+        ],
+    }
+    tool_result = {
+        "type": "tool_result",
+        "tool_use_id": tool_use_id,
+        "is_error": False,
+        "content": [
+            {"type": "text", "text": "ok"},
+            {
+                "type": "image",
+                "source": {"type": "base64", "media_type": "image/png", "data": FAKE_IMAGE},
+            },
+        ],
+    }
+    return assistant, {"role": "user", "content": [tool_result]}
+
+
+def bench(turns: int, keep: int, checkpoints: list[int]):
+    rescan_messages: list[dict] = [{"role": "user", "content": "Start testing"}]
+    index_messages: list[dict] = [{"role": "user", "content": "Start testing"}]
+    index = ImageIndex.from_messages(index_messages)
+    rescan_total = index_total = 0.0
+    window_start = 0
+
+    print(f"{'turns':>8} {'rescan us/turn':>16} {'index us/turn':>15}")
+    for turn in range(1, turns + 1):
+        assistant, user = _turn(turn)
+        rescan_messages += [assistant, user]
+        started = time.perf_counter()
+        _maybe_filter_to_n_most_recent_images(rescan_messages, keep)
+        rescan_total += time.perf_counter() - started
+
+        assistant, user = _turn(turn)
+        index_messages += [assistant, user]
+        started = time.perf_counter()
+        index.add(user["content"][0])
+        index.prune(keep)
+        index_total += time.perf_counter() - started
+
+        if turn in checkpoints:
+            window = turn - window_start
+            print(
+                f"{turn:>8} {rescan_total / window * 1e6:>16.1f} {index_total / window * 1e6:>15.1f}"
+            )
+            rescan_total = index_total = 0.0
+            window_start = turn
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--keep", type=int, default=10)
+    args = parser.parse_args()
+    checkpoints = [n for n in (10, 100, 250, 500, 1000, 2000, 5000) if n <= args.turns]
+    if args.turns not in checkpoints:
+        checkpoints.append(args.turns)
+    bench(args.turns, args.keep, checkpoints)
+
+
+if __name__ == "__main__":
+    main()
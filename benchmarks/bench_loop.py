@@ -0,0 +1,128 @@
+"""
+Loop-overhead benchmark: drives `sampling_loop` against the local fake Messages API
+with fake tools that return synthetic screenshots, and reports per-turn CPU time,
+retained size of `messages` and bytes sent to the API.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_loop --turns 10 100 1000 --image-kb 200
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import sys
+import time
+from typing import Any
+
+from benchmarks.fake_api import FakeMessagesServer
+from loop import APIProvider, sampling_loop
+from tools import ToolCollection, ToolResult
+from tools.base import BaseAnthropicTool
+
+
+class FakeComputerTool(BaseAnthropicTool):
+    """Answers every action instantly with a distinct synthetic screenshot."""
+
+    name = "computer"
+
+    def __init__(self, image_bytes: int):
+        self._image = bytearray(os.urandom(image_bytes))
+        self._calls = 0
+
+    def to_params(self):
+        return {
+            "name": self.name,
+            "type": "computer_20241022",
+            "display_width_px": 1366,
+            "display_height_px": 768,
+        }
+
+    async def __call__(self, **kwargs):
+        self._calls += 1
+        self._image[: 8] = self._calls.to_bytes(8, "little")
+        return ToolResult(output="", base64_image=base64.b64encode(self._image).decode())
+
+
+def _deep_size(obj: Any, seen: set[int] | None = None) -> int:
+    """Approximate number of bytes retained by a nest of containers."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(k, seen) + _deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(_deep_size(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += _deep_size(vars(obj), seen)
+    return size
+
+
+async def bench(server: FakeMessagesServer, turns: int, args: argparse.Namespace):
+    server.reset(turns)
+    messages: list = [{"role": "user", "content": "Start testing"}]
+    cpu_started, wall_started = time.process_time(), time.perf_counter()
+    await sampling_loop(
+        spreadsheet_id="benchmark",
+        test_cases=[],
+        model="fake",
+        provider=APIProvider.ANTHROPIC,
+        system_prompt_suffix="",
+        messages=messages,
+        output_callback=lambda block: None,
+        tool_output_callback=lambda result, tool_id: None,
+        api_response_callback=lambda response: None,
+        api_key="fake",
+        only_n_most_recent_images=args.keep_images,
+        only_n_most_recent_messages=args.keep_messages,
+        tool_collection=ToolCollection(FakeComputerTool(args.image_kb * 1024)),
+        stream=args.stream,
+        context_token_budget=args.token_budget,
+    )
+    cpu = time.process_time() - cpu_started
+    wall = time.perf_counter() - wall_started
+    stats = server.stats()
+    return {
+        "turns": turns,
+        "cpu_ms_per_turn": cpu / turns * 1000,
+        "wall_ms_per_turn": wall / turns * 1000,
+        "messages": len(messages),
+        "messages_mb": _deep_size(messages) / 2**20,
+        "sent_mb": stats["request_bytes"] / 2**20,
+        "sent_kb_per_turn": stats["request_bytes"] / stats["requests"] / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--image-kb", type=int, default=100, help="size of each synthetic screenshot")
+    parser.add_argument("--keep-images", type=int, default=10)
+    parser.add_argument("--keep-messages", type=int, default=None)
+    parser.add_argument("--token-budget", type=int, default=None)
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--verbose", action="store_true", help="keep the loop's debug prints")
+    args = parser.parse_args()
+
+    columns = ["turns", "cpu_ms_per_turn", "wall_ms_per_turn", "messages", "messages_mb", "sent_mb", "sent_kb_per_turn"]
+    with FakeMessagesServer() as server:
+        os.environ["ANTHROPIC_BASE_URL"] = server.base_url
+        print(" ".join(f"{column:>17}" for column in columns))
+        for turns in args.turns:
+            stdout = sys.stdout
+            if not args.verbose:
+                sys.stdout = open(os.devnull, "w")
+            try:
+                row = asyncio.run(bench(server, turns, args))
+            finally:
+                if sys.stdout is not stdout:
+                    sys.stdout.close()
+                sys.stdout = stdout
+            print(" ".join(f"{row[column]:>17.2f}" if isinstance(row[column], float) else f"{row[column]:>17}" for column in columns))
+
+
+if __name__ == "__main__":
+    main()
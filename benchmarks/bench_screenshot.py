@@ -0,0 +1,105 @@
+"""
+Screenshot benchmark: compares the subprocess capture path (`screencapture` + `sips`
++ temp file) with the in-process mss path (capture, resize and encode in memory).
+
+Backends that cannot run on this machine are skipped. The `memory` row resizes and
+encodes a synthetic frame of the given size, which isolates the in-process pipeline
+from the capture itself and runs anywhere Pillow is installed.
+
+    python -m benchmarks.bench_screenshot --iterations 20
+"""
+
+import argparse
+import asyncio
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from tools.computer import SCALE_DESTINATION
+from tools.encoding import ImageEncoder
+from tools.screen import CaptureBackend, Frame, MssBackend, SubprocessBackend, mss, resize
+
+SIZE = (SCALE_DESTINATION["width"], SCALE_DESTINATION["height"])
+
+
+class SyntheticBackend(CaptureBackend):
+    """Serves a fixed, desktop-like frame so that only resizing and encoding are measured."""
+
+    name = "memory"
+
+    def __init__(self, width: int, height: int):
+        from PIL import Image, ImageDraw
+
+        self._source = Image.new("RGB", (width, height), "white")
+        draw = ImageDraw.Draw(self._source)
+        rng = random.Random(0)
+        for _ in range(40):
+            x, y = rng.randrange(width), rng.randrange(height)
+            color = tuple(rng.randrange(256) for _ in range(3))
+            draw.rectangle((x, y, x + rng.randrange(400), y + rng.randrange(200)), fill=color)
+        for y in range(0, height, 24):
+            draw.text((20, y), "The quick brown fox jumps over the lazy dog " * 6, fill="black")
+
+    async def capture(self, size=None):
+        image = resize(self._source, size) if size else self._source.copy()
+        return Frame(width=image.width, height=image.height, image=image)
+
+
+def backends(args: argparse.Namespace, output_dir: str) -> list[CaptureBackend]:
+    found: list[CaptureBackend] = []
+    if shutil.which("screencapture") and shutil.which("sips"):
+        found.append(SubprocessBackend(output_dir))
+    if mss is not None:
+        try:
+            backend = MssBackend(args.display)
+            backend._grab()
+            found.append(backend)
+        except Exception as e:
+            print(f"skipping mss: {e}")
+        found.append(SyntheticBackend(*args.source_size))
+    return found
+
+
+async def bench(backend: CaptureBackend, encoder: ImageEncoder, iterations: int) -> dict:
+    timings, sizes = [], []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        frame = await backend.capture(SIZE)
+        encoded = encoder.encode(frame)
+        timings.append((time.perf_counter() - started) * 1000)
+        sizes.append(len(encoded.data))
+    timings.sort()
+    return {
+        "backend": backend.name,
+        "mean_ms": statistics.mean(timings),
+        "p50_ms": timings[len(timings) // 2],
+        "p95_ms": timings[int(len(timings) * 0.95) - 1],
+        "image_kb": statistics.mean(sizes) / 1024,
+        "media_type": encoded.media_type,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--display", default=None, help="X11 display for mss, e.g. :1")
+    parser.add_argument(
+        "--source-size", type=int, nargs=2, default=[2732, 1536], help="synthetic frame size"
+    )
+    parser.add_argument("--format", default="png", choices=["auto", "png", "webp", "jpeg"])
+    parser.add_argument("--quality", type=int, default=80)
+    args = parser.parse_args()
+
+    encoder = ImageEncoder(format=args.format, quality=args.quality, max_bytes=None)
+    columns = ["backend", "mean_ms", "p50_ms", "p95_ms", "image_kb", "media_type"]
+    print(" ".join(f"{column:>12}" for column in columns))
+    with tempfile.TemporaryDirectory() as output_dir:
+        for backend in backends(args, output_dir):
+            row = asyncio.run(bench(backend, encoder, args.iterations))
+            print(" ".join(f"{row[c]:>12.2f}" if isinstance(row[c], float) else f"{row[c]:>12}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
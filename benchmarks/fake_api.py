@@ -0,0 +1,154 @@
+"""
+Local fake of the Messages API for offline benchmarks.
+
+Every request is answered with a scripted computer tool_use until the configured
+number of turns is reached, then with a final text message. Both buffered and
+streamed (SSE) responses are supported. The server runs in its own process so its
+CPU time does not count against the loop being measured.
+"""
+
+import json
+import multiprocessing
+import socket
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from typing import Any
+from urllib.request import Request, urlopen
+
+SCRIPT: list[dict[str, Any]] = [
+    {"action": "screenshot"},
+    {"action": "mouse_move", "coordinate": [400, 300]},
+    {"action": "left_click"},
+    {"action": "type", "text": "hello world"},
+    {"action": "key", "text": "Return"},
+]
+
+
+def _message(turn: int, turns: int) -> dict[str, Any]:
+    content: list[dict[str, Any]] = [{"type": "text", "text": f"Step {turn}: continuing the test."}]
+    if turn < turns:
+        content.append(
+            {
+                "type": "tool_use",
+                "id": f"toolu_{turn:06d}",
+                "name": "computer",
+                "input": SCRIPT[turn % len(SCRIPT)],
+            }
+        )
+    return {
+        "id": f"msg_{turn:06d}",
+        "type": "message",
+        "role": "assistant",
+        "model": "fake",
+        "content": content,
+        "stop_reason": "tool_use" if turn < turns else "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": 1000, "output_tokens": 50},
+    }
+
+
+def _events(message: dict[str, Any]) -> list[dict[str, Any]]:
+    events: list[dict[str, Any]] = [
+        {"type": "message_start", "message": {**message, "content": [], "stop_reason": None}}
+    ]
+    for index, block in enumerate(message["content"]):
+        if block["type"] == "text":
+            events += [
+                {"type": "content_block_start", "index": index, "content_block": {"type": "text", "text": ""}},
+                {"type": "content_block_delta", "index": index, "delta": {"type": "text_delta", "text": block["text"]}},
+            ]
+        else:
+            events += [
+                {"type": "content_block_start", "index": index, "content_block": {**block, "input": {}}},
+                {
+                    "type": "content_block_delta",
+                    "index": index,
+                    "delta": {"type": "input_json_delta", "partial_json": json.dumps(block["input"])},
+                },
+            ]
+        events.append({"type": "content_block_stop", "index": index})
+    events += [
+        {
+            "type": "message_delta",
+            "delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+            "usage": {"output_tokens": message["usage"]["output_tokens"]},
+        },
+        {"type": "message_stop"},
+    ]
+    return events
+
+
+def _serve(port: int, ready):
+    state = {"turns": 0, "turn": count(1), "requests": 0, "request_bytes": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, data: dict[str, Any]):
+            body = json.dumps(data).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self._send_json({"requests": state["requests"], "request_bytes": state["request_bytes"]})
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            if self.path == "/reset":
+                state.update(json.loads(body), turn=count(1), requests=0, request_bytes=0)
+                return self._send_json({})
+            state["requests"] += 1
+            state["request_bytes"] += len(body)
+            message = _message(next(state["turn"]), state["turns"])
+            if not json.loads(body).get("stream"):
+                return self._send_json(message)
+            chunks = b"".join(
+                f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode()
+                for event in _events(message)
+            )
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Content-Length", str(len(chunks)))
+            self.end_headers()
+            self.wfile.write(chunks)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    ready.set()
+    server.serve_forever()
+
+
+class FakeMessagesServer:
+    """Runs the fake API in a child process; use as a context manager."""
+
+    def __init__(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self._process: multiprocessing.Process | None = None
+
+    def __enter__(self):
+        ready = multiprocessing.Event()
+        self._process = multiprocessing.Process(target=_serve, args=(self.port, ready), daemon=True)
+        self._process.start()
+        ready.wait(10)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._process:
+            self._process.terminate()
+            self._process.join()
+
+    def reset(self, turns: int):
+        """Answer the next `turns - 1` requests with a tool_use, then finish."""
+        request = Request(f"{self.base_url}/reset", data=json.dumps({"turns": turns}).encode(), method="POST")
+        urlopen(request).read()
+
+    def stats(self) -> dict[str, int]:
+        return json.loads(urlopen(f"{self.base_url}/stats").read())
@@ -0,0 +1,315 @@
+"""
+Record/replay cassettes for the sampling loop.
+
+A recording cassette captures every API response (streamed or not) and every
+ToolResult of a live run in a gzipped JSONL file. Screenshots are stored once per
+distinct image. A replaying cassette serves those responses and results back in
+place of the provider client and the tools, so the loop, image pruning and UI
+callbacks can be profiled offline, deterministically and at full speed.
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+import warnings
+from collections import deque
+from dataclasses import asdict
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Literal
+
+import httpx
+from anthropic.types.beta import BetaMessage, BetaRawMessageStreamEvent
+from pydantic import TypeAdapter
+
+from tools import ToolCollection
+from tools.base import BaseAnthropicTool, CLIResult, ToolError, ToolFailure, ToolResult
+
+CassetteMode = Literal["record", "replay"]
+
+_RESULT_TYPES: dict[str, type[ToolResult]] = {
+    cls.__name__: cls for cls in (ToolResult, CLIResult, ToolFailure)
+}
+_stream_event = TypeAdapter(BetaRawMessageStreamEvent)
+
+
+def _request_digest(request: dict[str, Any]) -> str:
+    """Fingerprint of a request, used to notice a replay drifting from the recording."""
+    payload = json.dumps(
+        {key: request.get(key) for key in ("model", "system", "messages", "tools")},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+class CassetteMismatch(Exception):
+    """Raised when a replayed run asks for something the recording does not contain."""
+
+
+class Cassette:
+    """An on-disk recording of one sampling loop run."""
+
+    def __init__(self, path: str | Path, mode: CassetteMode):
+        self.path = Path(path)
+        self.mode = mode
+        self._blobs: dict[str, str] = {}
+        self._tool_seq = 0
+        # streamed responses are recorded from the stream's producer thread, while tools
+        # started early record on the event loop thread
+        self._lock = threading.RLock()
+        if mode == "record":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = gzip.open(self.path, "wt")
+        else:
+            self._api: deque[dict[str, Any]] = deque()
+            self._tools: dict[int, dict[str, Any]] = {}
+            self._tool_params: list[dict[str, Any]] = []
+            self._load()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def close(self):
+        if self.mode == "record":
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # recording
+
+    def _write(self, entry: dict[str, Any]):
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def _blob(self, data: str) -> str:
+        """Store base64 data once and return its content address."""
+        digest = hashlib.sha256(data.encode()).hexdigest()[:24]
+        with self._lock:
+            if digest not in self._blobs:
+                self._blobs[digest] = data
+                self._write({"kind": "blob", "sha": digest, "data": data})
+        return digest
+
+    def _record_api(self, request: dict[str, Any], **response: Any):
+        self._write({"kind": "api", "digest": _request_digest(request), **response})
+
+    def _record_tool(self, seq: int, name: str, result: ToolResult):
+        fields = asdict(result)
+        if fields.get("base64_image"):
+            fields["base64_image"] = {"blob": self._blob(fields["base64_image"])}
+        self._write(
+            {
+                "kind": "tool",
+                "seq": seq,
+                "name": name,
+                "type": type(result).__name__,
+                "result": fields,
+            }
+        )
+
+    # replaying
+
+    def _load(self):
+        with gzip.open(self.path, "rt") as file:
+            for line in file:
+                entry = json.loads(line)
+                if entry["kind"] == "blob":
+                    self._blobs[entry["sha"]] = entry["data"]
+                elif entry["kind"] == "api":
+                    self._api.append(entry)
+                elif entry["kind"] == "tool":
+                    self._tools[entry["seq"]] = entry
+                elif entry["kind"] == "tools":
+                    self._tool_params = entry["params"]
+
+    def _next_api(self, request: dict[str, Any], stream: bool) -> dict[str, Any]:
+        if not self._api:
+            raise CassetteMismatch(f"{self.path} has no more recorded API responses")
+        entry = self._api.popleft()
+        if ("events" in entry) != stream:
+            raise CassetteMismatch(
+                f"{self.path} was recorded with stream={not stream}, replay it the same way"
+            )
+        if entry["digest"] != _request_digest(request):
+            warnings.warn(
+                f"Cassette request {entry['digest']} differs from the replayed request",
+                stacklevel=2,
+            )
+        return entry
+
+    def _next_tool(self, seq: int, name: str) -> ToolResult:
+        entry = self._tools.get(seq)
+        if entry is None or entry["name"] != name:
+            raise CassetteMismatch(f"{self.path} has no recorded result #{seq} for {name}")
+        fields = dict(entry["result"])
+        if isinstance(fields.get("base64_image"), dict):
+            fields["base64_image"] = self._blobs[fields["base64_image"]["blob"]]
+        return _RESULT_TYPES[entry["type"]](**fields)
+
+    # loop integration
+
+    def wrap_client(self, client: Any) -> Any:
+        """Return a client that records through `client`, or replays without it."""
+        return SimpleNamespace(beta=SimpleNamespace(messages=_Messages(self, client)))
+
+    def wrap_tools(self, tool_collection: ToolCollection | None) -> ToolCollection:
+        """Return tools that record their results, or replay them without touching the screen."""
+        if self.replaying:
+            return ToolCollection(
+                *(_ReplayTool(self, params) for params in self._tool_params)
+            )
+        assert tool_collection is not None
+        self._write(
+            {
+                "kind": "tools",
+                "params": [
+                    {**tool.to_params(), "parallel_safe": tool.parallel_safe}
+                    for tool in tool_collection.tools
+                ],
+            }
+        )
+        return ToolCollection(*(_RecordingTool(self, tool) for tool in tool_collection.tools))
+
+
+class _RecordingTool(BaseAnthropicTool):
+    def __init__(self, cassette: Cassette, tool: BaseAnthropicTool):
+        self._cassette = cassette
+        self._tool = tool
+        self.parallel_safe = tool.parallel_safe
+        self.streams_output = tool.streams_output
+
+    def to_params(self):
+        return self._tool.to_params()
+
+    def forget_sent_images(self):
+        self._tool.forget_sent_images()
+
+    def prefetch(self):
+        self._tool.prefetch()
+
+    def end_test_case(self):
+        self._tool.end_test_case()
+
+    def close(self):
+        self._tool.close()
+
+    async def aclose(self):
+        await self._tool.aclose()
+
+    async def __call__(self, **kwargs):
+        # sequence numbers are taken at dispatch, so overlapping tools replay in order
+        seq = self._cassette._tool_seq = self._cassette._tool_seq + 1
+        try:
+            result = await self._tool(**kwargs)
+        except ToolError as e:
+            self._cassette._record_tool(seq, self.to_params()["name"], ToolFailure(error=e.message))
+            raise
+        self._cassette._record_tool(seq, self.to_params()["name"], result)
+        return result
+
+
+class _ReplayTool(BaseAnthropicTool):
+    def __init__(self, cassette: Cassette, params: dict[str, Any]):
+        self._cassette = cassette
+        self.parallel_safe = params.pop("parallel_safe", False)
+        self._params = params
+
+    def to_params(self):
+        return dict(self._params)
+
+    async def __call__(self, **kwargs):
+        seq = self._cassette._tool_seq = self._cassette._tool_seq + 1
+        return self._cassette._next_tool(seq, self._params["name"])
+
+
+class _ReplayResponse:
+    """Stands in for APIResponse, with enough HTTP detail for the Streamlit logs."""
+
+    def __init__(self, data: dict[str, Any]):
+        self._data = data
+        self.http_request = httpx.Request(
+            "POST", "https://replay.invalid/v1/messages", content=b"{}"
+        )
+        self.http_response = httpx.Response(200, json=data, request=self.http_request)
+        self.headers = self.http_response.headers
+
+    def parse(self) -> BetaMessage:
+        return BetaMessage.model_validate(self._data)
+
+
+class _ReplayStream:
+    def __init__(self, events: list[dict[str, Any]]):
+        self._events = events
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def __iter__(self):
+        for event in self._events:
+            yield _stream_event.validate_python(event)
+
+
+class _RecordingStream:
+    def __init__(self, cassette: Cassette, request: dict[str, Any], stream: Any):
+        self._cassette = cassette
+        self._request = request
+        self._stream = stream
+
+    def __enter__(self):
+        self._stream.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._stream.__exit__(*exc_info)
+
+    def __iter__(self):
+        events = []
+        for event in self._stream:
+            events.append(event.model_dump(mode="json"))
+            yield event
+        self._cassette._record_api(self._request, events=events)
+
+
+class _RawMessages:
+    def __init__(self, cassette: Cassette, messages: Any):
+        self._cassette = cassette
+        self._messages = messages
+
+    def create(self, **request: Any):
+        if self._cassette.replaying:
+            entry = self._cassette._next_api(request, stream=False)
+            return _ReplayResponse(entry["response"])
+        raw_response = self._messages.with_raw_response.create(**request)
+        self._cassette._record_api(
+            request, response=raw_response.parse().model_dump(mode="json")
+        )
+        return raw_response
+
+
+class _Messages:
+    def __init__(self, cassette: Cassette, client: Any):
+        self._cassette = cassette
+        messages = None if client is None else client.beta.messages
+        self._messages = messages
+        self.with_raw_response = _RawMessages(cassette, messages)
+
+    def create(self, **request: Any):
+        if not request.get("stream"):
+            return self.with_raw_response.create(**request).parse()
+        if self._cassette.replaying:
+            entry = self._cassette._next_api(request, stream=True)
+            return _ReplayStream(entry["events"])
+        return _RecordingStream(self._cassette, request, self._messages.create(**request))
+
@@ -0,0 +1,221 @@
+"""
+Token-budgeted compaction of the sampling loop conversation.
+
+Finished test cases are collapsed into short summaries first, then the oldest tool
+exchanges are dropped. Messages are only ever removed as whole assistant/user pairs,
+so every tool_result keeps its tool_use, and always in large chunks so that the
+cached conversation prefix survives between compactions.
+"""
+
+import json
+from typing import Any
+
+from anthropic.types.beta import BetaMessageParam, BetaTextBlock
+
+from tools.tracing import span
+
+CHARS_PER_TOKEN = 4
+# a screenshot scaled to SCALE_DESTINATION costs roughly width * height / 750 tokens
+IMAGE_TOKENS = 1400
+SUMMARY_MARKER = "<COMPLETED_TEST_CASE"
+SUMMARY_REPLY = "Continue with the test plan."
+
+
+def _get(block: Any, key: str, default: Any = None) -> Any:
+    """Read a field from a content block, which is either a dict or an SDK model."""
+    if isinstance(block, dict):
+        return block.get(key, default)
+    return getattr(block, key, default)
+
+
+def _estimate_content_tokens(content: Any) -> int:
+    if isinstance(content, str):
+        return len(content) // CHARS_PER_TOKEN
+    tokens = 0
+    for block in content or []:
+        block_type = _get(block, "type")
+        if block_type == "text":
+            tokens += len(_get(block, "text", "")) // CHARS_PER_TOKEN
+        elif block_type == "image":
+            tokens += IMAGE_TOKENS
+        elif block_type == "tool_use":
+            tokens += len(json.dumps(_get(block, "input", {}))) // CHARS_PER_TOKEN
+        elif block_type == "tool_result":
+            tokens += _estimate_content_tokens(_get(block, "content"))
+    return tokens
+
+
+def estimate_tokens(message: BetaMessageParam) -> int:
+    """Cheap input token estimate for one message."""
+    return _estimate_content_tokens(message["content"]) + 4
+
+
+def _is_summary(message: BetaMessageParam) -> bool:
+    content = message["content"]
+    return (
+        message["role"] == "assistant"
+        and isinstance(content, list)
+        and bool(content)
+        and str(_get(content[0], "text", "")).startswith(SUMMARY_MARKER)
+    )
+
+
+def _tool_uses(message: BetaMessageParam) -> list[Any]:
+    content = message["content"]
+    if message["role"] != "assistant" or not isinstance(content, list):
+        return []
+    return [block for block in content if _get(block, "type") == "tool_use"]
+
+
+def _first_exchange(messages: list[BetaMessageParam]) -> int:
+    """Index of the oldest assistant/user pair that is not a test case summary."""
+    index = 1
+    while index + 1 < len(messages) and _is_summary(messages[index]):
+        index += 2
+    return index
+
+
+def drop_oldest_exchanges(
+    messages: list[BetaMessageParam],
+    keep: int,
+    min_removal: int = 10,
+    keep_summaries: bool = False,
+) -> list[BetaMessageParam]:
+    """
+    Remove the oldest assistant/user pairs after the first user message, in place,
+    until at most `keep` messages remain. Once over the limit at least `min_removal`
+    messages are removed, to reduce how often the prompt cache is broken.
+    Returns the removed messages.
+    """
+    if len(messages) <= keep:
+        return []
+    target = min(keep, len(messages) - min_removal)
+    start = _first_exchange(messages) if keep_summaries else 1
+    removed: list[BetaMessageParam] = []
+    end = start
+    # always keep the latest exchange, which the model has not answered yet
+    while len(messages) - len(removed) > target and end + 1 < len(messages) - 2:
+        removed += messages[end : end + 2]
+        end += 2
+    del messages[start:end]
+    return removed
+
+
+class ContextCompactor:
+    """
+    Keeps a running token estimate of the conversation and compacts it once the
+    estimate exceeds `token_budget`, down to `token_budget * target_ratio` and by at
+    least `min_removal` messages.
+    """
+
+    def __init__(
+        self,
+        token_budget: int,
+        target_ratio: float = 0.6,
+        record_tool_name: str = "record_test_result",
+        summary_chars: int = 300,
+        min_removal: int = 10,
+    ):
+        self.token_budget = token_budget
+        self.target_ratio = target_ratio
+        self.record_tool_name = record_tool_name
+        self.summary_chars = summary_chars
+        self.min_removal = min_removal
+        self.estimated_tokens = 0
+        self.compactions = 0
+
+    def observe(self, *messages: BetaMessageParam):
+        """Account for messages appended to the conversation."""
+        self.estimated_tokens += sum(estimate_tokens(message) for message in messages)
+
+    def forget(self, *messages: BetaMessageParam):
+        """Account for messages removed from the conversation by someone else."""
+        self.estimated_tokens -= sum(estimate_tokens(message) for message in messages)
+
+    def images_removed(self, count: int):
+        """Account for screenshots pruned from the conversation."""
+        self.estimated_tokens -= count * IMAGE_TOKENS
+
+    def maybe_compact(self, messages: list[BetaMessageParam]) -> list[BetaMessageParam]:
+        """Compact `messages` in place if over budget. Returns the removed messages."""
+        if self.estimated_tokens <= self.token_budget:
+            return []
+        tokens = self._estimate(messages)
+        if tokens <= self.token_budget:
+            # the running estimate drifted, e.g. through images counted twice
+            self.estimated_tokens = tokens
+            return []
+        target = self.token_budget * self.target_ratio
+        with span("context.compact", tokens=tokens) as compact_span:
+            removed, tokens = self._collapse_finished_test_cases(messages, tokens, target)
+            keep_summaries = True
+            # remove a large chunk at once, so the cached prefix is not broken every turn
+            while tokens > target or (keep_summaries and len(removed) < self.min_removal):
+                dropped = drop_oldest_exchanges(
+                    messages, len(messages) - 2, min_removal=2, keep_summaries=keep_summaries
+                )
+                if not dropped:
+                    if keep_summaries and tokens > target:
+                        # the summaries alone are over the target, let the oldest go
+                        keep_summaries = False
+                        continue
+                    break
+                tokens -= sum(map(estimate_tokens, dropped))
+                removed += dropped
+            self.estimated_tokens = tokens
+            compact_span.attributes.update(removed=len(removed), tokens_left=tokens)
+        if removed:
+            self.compactions += 1
+        return removed
+
+    def _estimate(self, messages: list[BetaMessageParam]) -> int:
+        return sum(estimate_tokens(message) for message in messages)
+
+    def _collapse_finished_test_cases(
+        self, messages: list[BetaMessageParam], tokens: int, target: float
+    ) -> tuple[list[BetaMessageParam], int]:
+        """Replace finished test cases, oldest first, by a summary exchange each."""
+        removed: list[BetaMessageParam] = []
+        start = index = _first_exchange(messages)
+        while tokens > target and index + 1 < len(messages):
+            records = [
+                block
+                for block in _tool_uses(messages[index])
+                if _get(block, "name") == self.record_tool_name
+            ]
+            if not records:
+                index += 2
+                continue
+            span = messages[start : index + 2]
+            summary = self._summarize(span, records)
+            messages[start : index + 2] = summary
+            removed += span
+            tokens += sum(map(estimate_tokens, summary)) - sum(map(estimate_tokens, span))
+            start = index = start + len(summary)
+        return removed, tokens
+
+    def _summarize(
+        self, span: list[BetaMessageParam], records: list[Any]
+    ) -> list[BetaMessageParam]:
+        notes = " ".join(
+            str(_get(block, "text", ""))
+            for message in span
+            if message["role"] == "assistant" and isinstance(message["content"], list)
+            for block in message["content"]
+            if _get(block, "type") == "text"
+        )
+        if len(notes) > self.summary_chars:
+            notes = notes[: self.summary_chars] + "..."
+        results = ", ".join(
+            f"{_get(block, 'input', {}).get('test_id')}: {_get(block, 'input', {}).get('status')}"
+            for block in records
+        )
+        tool_calls = sum(len(_tool_uses(message)) for message in span)
+        text = (
+            f"{SUMMARY_MARKER} results=\"{results}\" tool_calls=\"{tool_calls}\">\n"
+            f"{notes}\n</COMPLETED_TEST_CASE>"
+        )
+        return [
+            {"role": "assistant", "content": [BetaTextBlock(type="text", text=text)]},
+            {"role": "user", "content": [BetaTextBlock(type="text", text=SUMMARY_REPLY)]},
+        ]
@@ -2,29 +2,45 @@
 Agentic sampling loop that calls the Anthropic API and local implementation of anthropic-defined computer use tools.
 """
 
+import asyncio
+import json
 import platform
-from collections.abc import Callable
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Callable, Iterable
+from dataclasses import dataclass
 from datetime import datetime
 from enum import StrEnum
+from pathlib import Path
 from typing import Any, cast
 
-from anthropic import Anthropic, AnthropicBedrock, AnthropicVertex, APIResponse
+from anthropic import APIResponse, Stream
 from anthropic.types import (
     ToolResultBlockParam,
 )
 from anthropic.types.beta import (
+    BetaCacheControlEphemeralParam,
     BetaContentBlock,
     BetaContentBlockParam,
     BetaImageBlockParam,
     BetaMessage,
     BetaMessageParam,
+    BetaTextBlock,
     BetaTextBlockParam,
     BetaToolResultBlockParam,
+    BetaToolUseBlock,
 )
 
-from tools import BashTool, ComputerTool, EditTool, ToolCollection, ToolResult, RecordTestResultTool
+from cassette import Cassette
+from compaction import ContextCompactor, drop_oldest_exchanges
+from tools import BashTool, ComputerMacroTool, ComputerTool, ComputerZoomTool, EditTool, ToolCollection, ToolResult, RecordTestResultTool
+from tools.clients import get_client
+from tools.computer import OUTPUT_DIR
+from tools.display import DisplayPool, XvfbDisplay
+from tools.tracing import set_test_case, span
 
 BETA_FLAG = "computer-use-2024-10-22"
+PROMPT_CACHING_BETA_FLAG = "prompt-caching-2024-07-31"
 
 
 class APIProvider(StrEnum):
@@ -40,6 +56,29 @@ PROVIDER_TO_DEFAULT_MODEL_NAME: dict[APIProvider, str] = {
 }
 
 
+@dataclass
+class TurnStats:
+    """Token accounting for a single API call of the sampling loop."""
+
+    turn: int
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
+    # seconds since the request was sent
+    api_seconds: float = 0.0
+    first_token_seconds: float = 0.0
+    first_tool_seconds: float | None = None
+    turn_seconds: float = 0.0
+
+    @property
+    def overlap_seconds(self) -> float:
+        """Time tools spent running while the response was still being received."""
+        if self.first_tool_seconds is None:
+            return 0.0
+        return max(0.0, self.api_seconds - self.first_tool_seconds)
+
+
 # This system prompt is optimized for the Docker environment in this repository and
 # specific tool combinations enabled.
 # We encourage modifying this system prompt to ensure the model has context for the
@@ -59,7 +98,7 @@ PROVIDER_TO_DEFAULT_MODEL_NAME: dict[APIProvider, str] = {
 # * When using Chrome, if any first-time setup dialogs appear, IGNORE THEM. Instead, click directly in the address bar and enter the appropriate search term or URL there.
 # * If the item you are looking at is a pdf, if after taking a single screenshot of the pdf it seems that you want to read the entire document instead of trying to continue to read the pdf from your screenshots + navigation, determine the URL, use curl to download the pdf, install and use pdftotext (available via homebrew) to convert it to a text file, and then read that text file directly with your StrReplaceEditTool.
 # </IMPORTANT>"""
-SYSTEM_PROMPT = f"""<SYSTEM_CAPABILITY>
+MACOS_CAPABILITY = f"""<SYSTEM_CAPABILITY>
 * You are utilizing a macOS Sonoma 15.7 environment using {platform.machine()} architecture with command line internet access.
 * Package management:
   - Use homebrew for package installation
@@ -94,12 +133,14 @@ SYSTEM_PROMPT = f"""<SYSTEM_CAPABILITY>
 
 * The current date is {datetime.today().strftime('%A, %B %-d, %Y')}.
 </SYSTEM_CAPABILITY>
+"""
 
+# the parts that differ between the Mac and the Xvfb displays are filled in below
+USER_INTERACTION_GUIDELINES = """
 <USER_INTERACTION_GUIDELINES>
-You are a QA Engineer. You will have open Chrome browser for you in incognito mode on the left side of your screen.
-On the right side of your screen, you will see yourself in browser. Do not interact with that browser tab.
+You are a QA Engineer. {browser_layout}
 
-Before you start testing, always tap on the Chrome window to make sure it is in focus.
+Before you start testing, always tap on the {browser} window to make sure it is in focus.
 
 You will be given a test plan and a set of test cases.
 
@@ -112,7 +153,7 @@ Then, take the necessary actions to verify that the expected results are met. On
 After you verified the results, record the status of the case case.
 
 After test case is finished and before you begin new one, open new incognito tab and start a new test case.
-To open a new incognito tab, use the following keyboard shortcut: Command + T (Cmd + T)
+To open a new incognito tab, use the following keyboard shortcut: {new_tab}
 You are already in incognito mode, so you dont need to open a new window, only a new tab.
 
 Do not ask user for confirmation before you start a new test case. Just go through all test cases, one by one.
@@ -121,6 +162,63 @@ When you are done with the test plan, reply with "Test plan complete".
 </USER_INTERACTION_GUIDELINES>
 """
 
+SYSTEM_PROMPT = MACOS_CAPABILITY + USER_INTERACTION_GUIDELINES.format(
+    browser="Chrome",
+    browser_layout=(
+        "You will have open Chrome browser for you in incognito mode on the left side of your screen.\n"
+        "On the right side of your screen, you will see yourself in browser. Do not interact with that browser tab."
+    ),
+    new_tab="Command + T (Cmd + T)",
+)
+
+
+def display_system_prompt(display: XvfbDisplay) -> str:
+    """System prompt for an agent on an Xvfb display: Linux, Chromium only, no Dock."""
+    capability = f"""<SYSTEM_CAPABILITY>
+* You are utilizing a Linux virtual display ({display.width}x{display.height}) using {platform.machine()} architecture with command line internet access.
+* There is no window manager, Dock or Spotlight. Chromium is the only application on the screen; GUI applications started with your bash tool open on the same display.
+* Use Ctrl where macOS keyboard shortcuts use Command.
+* Package management: use apt-get, pip or npm. Use curl for HTTP requests.
+
+* Output handling:
+  - For large output, redirect to tmp files: command > /tmp/output.txt
+  - Use grep with context: grep -n -B <before> -A <after> <query> <filename>
+
+* Note: Command line function calls may have latency. Chain multiple operations into single requests where feasible.
+
+* The current date is {datetime.today().strftime('%A, %B %-d, %Y')}.
+</SYSTEM_CAPABILITY>
+"""
+    return capability + USER_INTERACTION_GUIDELINES.format(
+        browser="Chromium",
+        browser_layout="You will have open Chromium browser for you in incognito mode, filling the whole screen.",
+        new_tab="Ctrl + T",
+    )
+
+
+def make_tool_collection(
+    worker_id: int | None = None, display: XvfbDisplay | None = None
+) -> ToolCollection:
+    """
+    Build the tools for one agent. Parallel workers get their own screenshot directory
+    so that each RecordTestResultTool attaches its own worker's evidence, and, given an
+    Xvfb display, their own screen, mouse and keyboard.
+    """
+    output_dir = OUTPUT_DIR if worker_id is None else str(Path(OUTPUT_DIR) / f"worker_{worker_id}")
+    if display is None:
+        computer = ComputerTool(output_dir=output_dir)
+    else:
+        computer = ComputerTool.for_display(display, output_dir=output_dir)
+    return ToolCollection(
+        computer,
+        ComputerMacroTool(computer),
+        ComputerZoomTool(computer),
+        BashTool(env=display.env if display else None),
+        EditTool(),
+        RecordTestResultTool(output_dir=output_dir, computer=computer),
+    )
+
+
 async def sampling_loop(
     *,
     spreadsheet_id: str,
@@ -136,16 +234,44 @@ async def sampling_loop(
     only_n_most_recent_images: int | None = None,
     only_n_most_recent_messages: int | None = None,
     max_tokens: int = 4096,
+    prompt_caching: bool = True,
+    turn_stats_callback: Callable[[TurnStats], None] | None = None,
+    tool_collection: ToolCollection | None = None,
+    stream: bool = False,
+    text_delta_callback: Callable[[str], None] | None = None,
+    context_token_budget: int | None = None,
+    cassette: Cassette | None = None,
+    tool_stream_callback: Callable[[str, str], None] | None = None,
+    system_prompt: str = SYSTEM_PROMPT,
 ):
     """
     Agentic sampling loop for the assistant/tool interaction of computer use.
+
+    With `stream=True` the response is streamed: text deltas are passed to
+    `text_delta_callback` as they arrive and each tool starts as soon as its input is
+    complete. `output_callback` still receives every finished content block, but
+    `api_response_callback` is not called because there is no buffered HTTP exchange.
+
+    With `context_token_budget` set, finished test cases are collapsed into summaries
+    and the oldest tool exchanges are dropped whenever the estimated input exceeds it.
+
+    A recording `cassette` captures every API response and tool result of the run; a
+    replaying one serves them back instead of calling the provider and the tools.
+
+    `tool_stream_callback` receives partial output of long-running tools (bash) with the
+    tool_use ID, rate limited, while they run; their final results are unchanged.
+
+    `system_prompt` describes the screen the tools drive, see `display_system_prompt`.
     """
-    tool_collection = ToolCollection(
-        ComputerTool(),
-        BashTool(),
-        EditTool(),
-        RecordTestResultTool(),
-    )
+    # tools passed in by the caller outlive this loop, those created here do not
+    owns_tools = tool_collection is None
+    if cassette and cassette.replaying:
+        tool_collection = cassette.wrap_tools(None)
+    else:
+        if tool_collection is None:
+            tool_collection = make_tool_collection()
+        if cassette:
+            tool_collection = cassette.wrap_tools(tool_collection)
 
     test_plan_str = f"""
 <SPREADSHEET_ID>
@@ -172,67 +298,394 @@ Expected results: {test_case['expected_results']}.
 
     print("SYSTEM PROMPT SUFFIX", system_prompt_suffix)
 
-    system = (
-        f"{SYSTEM_PROMPT}{' ' + system_prompt_suffix if system_prompt_suffix else ''}"
-    )
-
-    while True:
-        if only_n_most_recent_images:
-            _maybe_filter_to_n_most_recent_images(messages, only_n_most_recent_images)
-
-        if only_n_most_recent_messages:
-            messages = messages[-only_n_most_recent_messages:]
-
-        if provider == APIProvider.ANTHROPIC:
-            client = Anthropic(api_key=api_key)
-        elif provider == APIProvider.VERTEX:
-            client = AnthropicVertex()
-        elif provider == APIProvider.BEDROCK:
-            client = AnthropicBedrock()
-
-        # Call the API
-        # we use raw_response to provide debug information to streamlit. Your
-        # implementation may be able call the SDK directly with:
-        # `response = client.messages.create(...)` instead.
-        print(f"Sending length of messages: {len(messages)}")
-        raw_response = client.beta.messages.with_raw_response.create(
-            max_tokens=max_tokens,
-            messages=messages,
-            model=model,
-            system=system,
-            tools=tool_collection.to_params(),
-            betas=[BETA_FLAG],
+    # prompt caching is only available through the first-party API beta
+    enable_prompt_caching = prompt_caching and provider == APIProvider.ANTHROPIC
+    betas = [BETA_FLAG]
+    system: list[BetaTextBlockParam] = [{"type": "text", "text": system_prompt}]
+    if system_prompt_suffix:
+        system.append({"type": "text", "text": f" {system_prompt_suffix}"})
+    tools = tool_collection.to_params()
+    if enable_prompt_caching:
+        betas.append(PROMPT_CACHING_BETA_FLAG)
+        # tools and system are sent ahead of messages, so a breakpoint on each caches
+        # the tool definitions on their own and the tools + system + test plan prefix
+        tools[-1] = {**tools[-1], "cache_control": _ephemeral()}
+        system[-1]["cache_control"] = _ephemeral()
+
+    # the client is shared process-wide so keep-alive connections survive across turns
+    if cassette and cassette.replaying:
+        client = cassette.wrap_client(None)
+    else:
+        client = get_client(provider, api_key=api_key)
+        if cassette:
+            client = cassette.wrap_client(client)
+    turn = 0
+
+    image_index = ImageIndex.from_messages(messages)
+    compactor = None
+    if context_token_budget:
+        compactor = ContextCompactor(
+            context_token_budget, record_tool_name=RecordTestResultTool.name
         )
+        compactor.observe(*messages)
+
+    recorded_test_cases: set[str] = set()
+
+    try:
+        while True:
+            turn += 1
+            # spans of this turn, including those of the tools, belong to the first test
+            # case that has not been recorded yet
+            set_test_case(
+                next(
+                    (
+                        test_case["id"]
+                        for test_case in test_cases
+                        if test_case["id"] not in recorded_test_cases
+                    ),
+                    None,
+                )
+            )
+            if only_n_most_recent_images:
+                removed_images = image_index.prune(only_n_most_recent_images)
+                if compactor:
+                    compactor.images_removed(removed_images)
+
+            # messages are only dropped as whole tool_use/tool_result exchanges
+            if only_n_most_recent_messages:
+                removed = drop_oldest_exchanges(messages, only_n_most_recent_messages)
+                image_index.discard(removed)
+                if compactor:
+                    compactor.forget(*removed)
+
+            if compactor:
+                image_index.discard(compactor.maybe_compact(messages))
+
+            # unchanged screenshots refer back to the newest image, which may have been dropped
+            if not image_index:
+                tool_collection.forget_sent_images()
+
+            if enable_prompt_caching:
+                _inject_prompt_caching(messages)
+
+            request = dict(
+                max_tokens=max_tokens,
+                messages=messages,
+                model=model,
+                system=system,
+                tools=tools,
+                betas=betas,
+            )
+            print(f"Sending length of messages: {len(messages)}")
+            dispatcher = _ToolDispatcher(tool_collection, tool_output_callback, tool_stream_callback)
+            # e.g. capture the screenshot the next action probably asks for
+            tool_collection.prefetch()
+            started = time.perf_counter()
+            with span("api.call", turn=turn, stream=stream) as api_span:
+                if stream:
+                    response, first_token_at = await _stream_response(
+                        client, request, output_callback, text_delta_callback, dispatcher
+                    )
+                else:
+                    # Call the API
+                    # we use raw_response to provide debug information to streamlit. Your
+                    # implementation may be able call the SDK directly with:
+                    # `response = client.messages.create(...)` instead.
+                    # the SDK call blocks, run it in a thread so parallel workers are not serialized
+                    raw_response = await asyncio.to_thread(
+                        client.beta.messages.with_raw_response.create, **request
+                    )
+                    api_response_callback(cast(APIResponse[BetaMessage], raw_response))
+                    response = raw_response.parse()
+                    first_token_at = time.perf_counter()
+                api_span.attributes.update(
+                    input_tokens=response.usage.input_tokens,
+                    output_tokens=response.usage.output_tokens,
+                    cache_creation_input_tokens=response.usage.cache_creation_input_tokens or 0,
+                    cache_read_input_tokens=response.usage.cache_read_input_tokens or 0,
+                )
+            if not stream:
+                for content_block in cast(list[BetaContentBlock], response.content):
+                    print("CONTENT", content_block)
+                    output_callback(content_block)
+                    if content_block.type == "tool_use":
+                        dispatcher.dispatch(content_block)
+            response_at = time.perf_counter()
+
+            messages.append(
+                {
+                    "role": "assistant",
+                    "content": cast(list[BetaContentBlockParam], response.content),
+                }
+            )
 
-        api_response_callback(cast(APIResponse[BetaMessage], raw_response))
+            tool_result_content = await dispatcher.results()
+            for content_block in cast(list[BetaContentBlock], response.content):
+                if content_block.type == "tool_use" and content_block.name == RecordTestResultTool.name:
+                    recorded_test_cases.add(cast(dict[str, Any], content_block.input).get("test_id"))
+                    # e.g. give the next test case a fresh shell
+                    tool_collection.end_test_case()
+            for api_tool_result in tool_result_content:
+                image_index.add(api_tool_result)
+            finished_at = time.perf_counter()
+
+            stats = TurnStats(
+                turn=turn,
+                input_tokens=response.usage.input_tokens,
+                output_tokens=response.usage.output_tokens,
+                cache_creation_input_tokens=response.usage.cache_creation_input_tokens or 0,
+                cache_read_input_tokens=response.usage.cache_read_input_tokens or 0,
+                api_seconds=response_at - started,
+                first_token_seconds=first_token_at - started,
+                first_tool_seconds=(
+                    dispatcher.first_started_at - started
+                    if dispatcher.first_started_at is not None
+                    else None
+                ),
+                turn_seconds=finished_at - started,
+            )
+            if turn_stats_callback:
+                turn_stats_callback(stats)
 
-        response = raw_response.parse()
+            if compactor:
+                compactor.observe(messages[-1])
 
-        messages.append(
-            {
-                "role": "assistant",
-                "content": cast(list[BetaContentBlockParam], response.content),
-            }
-        )
+            if not tool_result_content:
+                return messages
+
+            messages.append({"content": tool_result_content, "role": "user"})
+            if compactor:
+                compactor.observe(messages[-1])
+    finally:
+        # e.g. the warm shells of the bash tool, also on errors and cancellation
+        if owns_tools:
+            await tool_collection.aclose()
 
-        tool_result_content: list[BetaToolResultBlockParam] = []
-        for content_block in cast(list[BetaContentBlock], response.content):
-            print("CONTENT", content_block)
-            output_callback(content_block)
-            if content_block.type == "tool_use":
-                result = await tool_collection.run(
-                    name=content_block.name,
-                    tool_input=cast(dict[str, Any], content_block.input),
-                )
-                tool_result_content.append(
-                    _make_api_tool_result(result, content_block.id)
-                )
-                tool_output_callback(result, content_block.id)
 
-        if not tool_result_content:
-            return messages
+class _ToolDispatcher:
+    """
+    Starts tool_use blocks as soon as they are dispatched and collects the API tool
+    results in dispatch order, which is the order the API requires.
+
+    Screen- and shell-mutating tools run one after another in dispatch order. Tools
+    marked `parallel_safe` wait for the mutating calls dispatched before them, so they
+    observe the same state as in a sequential run, but never hold up later calls.
+    """
 
-        messages.append({"content": tool_result_content, "role": "user"})
+    def __init__(
+        self,
+        tool_collection: ToolCollection,
+        tool_output_callback: Callable[[ToolResult, str], None],
+        tool_stream_callback: Callable[[str, str], None] | None = None,
+    ):
+        self._tool_collection = tool_collection
+        self._tool_output_callback = tool_output_callback
+        self._tool_stream_callback = tool_stream_callback
+        self._tasks: list[asyncio.Task[BetaToolResultBlockParam]] = []
+        self._last_serial: asyncio.Task | None = None
+        self.first_started_at: float | None = None
+
+    def dispatch(self, tool_use: BetaToolUseBlock):
+        task = asyncio.create_task(self._run(tool_use, self._last_serial))
+        if not self._tool_collection.is_parallel_safe(tool_use.name):
+            self._last_serial = task
+        self._tasks.append(task)
+
+    async def _run(
+        self, tool_use: BetaToolUseBlock, previous: asyncio.Task | None
+    ) -> BetaToolResultBlockParam:
+        if previous is not None:
+            await asyncio.wait([previous])
+        if self.first_started_at is None:
+            self.first_started_at = time.perf_counter()
+        stream_callback = self._tool_stream_callback
+        on_output = None
+        if stream_callback is not None:
+            on_output = lambda text: stream_callback(text, tool_use.id)
+        result = await self._tool_collection.run(
+            name=tool_use.name,
+            tool_input=cast(dict[str, Any], tool_use.input),
+            on_output=on_output,
+        )
+        self._tool_output_callback(result, tool_use.id)
+        return _make_api_tool_result(result, tool_use.id)
+
+    async def results(self) -> list[BetaToolResultBlockParam]:
+        return list(await asyncio.gather(*self._tasks))
+
+
+async def _stream_events(create: Callable[[], Stream[Any]]) -> AsyncIterator[Any]:
+    """Iterate a blocking SDK stream in a worker thread without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue[Any] = asyncio.Queue()
+    done = object()
+
+    def produce():
+        try:
+            with create() as events:
+                for event in events:
+                    loop.call_soon_threadsafe(queue.put_nowait, event)
+        except Exception as exc:
+            loop.call_soon_threadsafe(queue.put_nowait, exc)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    producer = asyncio.create_task(asyncio.to_thread(produce))
+    while (item := await queue.get()) is not done:
+        if isinstance(item, Exception):
+            raise item
+        yield item
+    await producer
+
+
+async def _stream_response(
+    client: Any,
+    request: dict[str, Any],
+    output_callback: Callable[[BetaContentBlock], None],
+    text_delta_callback: Callable[[str], None] | None,
+    dispatcher: _ToolDispatcher,
+) -> tuple[BetaMessage, float]:
+    """
+    Stream one response, handing each tool_use block to the dispatcher as soon as its
+    input JSON is complete, so tools run while the rest of the message is generated.
+    Returns the assembled message and the time its first content delta arrived.
+    """
+    message: BetaMessage | None = None
+    blocks: dict[int, BetaContentBlock] = {}
+    partial_json: dict[int, list[str]] = {}
+    first_token_at: float | None = None
+    async for event in _stream_events(
+        lambda: client.beta.messages.create(**request, stream=True)
+    ):
+        if event.type == "message_start":
+            message = event.message
+        elif event.type == "content_block_start":
+            blocks[event.index] = event.content_block
+            partial_json[event.index] = []
+        elif event.type == "content_block_delta":
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            if event.delta.type == "text_delta":
+                block = cast(BetaTextBlock, blocks[event.index])
+                block.text += event.delta.text
+                if text_delta_callback:
+                    text_delta_callback(event.delta.text)
+            elif event.delta.type == "input_json_delta":
+                partial_json[event.index].append(event.delta.partial_json)
+        elif event.type == "content_block_stop":
+            block = blocks[event.index]
+            if block.type == "tool_use":
+                raw_input = "".join(partial_json[event.index])
+                block.input = json.loads(raw_input) if raw_input else {}
+            print("CONTENT", block)
+            output_callback(block)
+            if block.type == "tool_use":
+                dispatcher.dispatch(block)
+        elif event.type == "message_delta":
+            assert message is not None
+            message.stop_reason = event.delta.stop_reason
+            message.stop_sequence = event.delta.stop_sequence
+            message.usage.output_tokens = event.usage.output_tokens
+
+    assert message is not None, "stream ended without a message_start event"
+    message.content = [blocks[index] for index in sorted(blocks)]
+    return message, first_token_at or time.perf_counter()
+
+
+async def sharded_sampling_loop(
+    *,
+    test_cases: list[dict[str, Any]],
+    workers: int,
+    tool_collection_factory: Callable[
+        [int, XvfbDisplay | None], ToolCollection
+    ] = make_tool_collection,
+    display_pool: DisplayPool | None = None,
+    start_message: str = "Start testing",
+    worker_kwargs_factory: Callable[[int], dict[str, Any]] | None = None,
+    **loop_kwargs: Any,
+) -> dict[str, list[BetaMessageParam]]:
+    """
+    Run a test plan across `workers` agents, each with its own conversation and its
+    own ToolCollection. Cases are handed out from a shared queue as workers free up,
+    and every worker records its results through its own RecordTestResultTool.
+
+    `loop_kwargs` are forwarded to `sampling_loop`, together with those
+    `worker_kwargs_factory` returns for a worker, e.g. callbacks that render into that
+    worker's own part of a UI. Every worker leases its own Xvfb display from
+    `display_pool` for as long as it runs, and is prompted for that display rather than
+    for the Mac. Without a pool all agents would drive the one screen, mouse and
+    keyboard at once, so only a single worker is allowed.
+
+    Returns the final conversation of each test case, keyed by test case ID.
+    """
+    if workers > 1 and display_pool is None:
+        raise ValueError(
+            "parallel workers need a display_pool, without one they share a single screen"
+        )
+    queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+    for test_case in test_cases:
+        queue.put_nowait(test_case)
+    conversations: dict[str, list[BetaMessageParam]] = {}
+
+    async def worker(worker_id: int):
+        display = await display_pool.lease() if display_pool else None
+        tool_collection = None
+        try:
+            tool_collection = tool_collection_factory(worker_id, display)
+            # an Xvfb display is a Linux screen, not the Mac the default prompt describes
+            worker_kwargs = {"system_prompt": display_system_prompt(display)} if display else {}
+            if worker_kwargs_factory:
+                worker_kwargs.update(worker_kwargs_factory(worker_id))
+            while not queue.empty():
+                test_case = queue.get_nowait()
+                with span("worker.test_case", worker=worker_id, test_case_id=test_case["id"]):
+                    conversations[test_case["id"]] = await sampling_loop(
+                        **{**loop_kwargs, **worker_kwargs},
+                        test_cases=[test_case],
+                        messages=[
+                            {"role": "user", "content": [{"type": "text", "text": start_message}]}
+                        ],
+                        tool_collection=tool_collection,
+                    )
+        finally:
+            if tool_collection is not None:
+                await tool_collection.aclose()
+            if display_pool and display:
+                await display_pool.release(display)
+
+    await asyncio.gather(*(worker(i) for i in range(min(workers, len(test_cases)))))
+    return conversations
+
+
+def _ephemeral() -> BetaCacheControlEphemeralParam:
+    return {"type": "ephemeral"}
+
+
+def _inject_prompt_caching(
+    messages: list[BetaMessageParam],
+    breakpoints: int = 2,
+):
+    """
+    Set cache breakpoints on the last block of the `breakpoints` most recent user
+    turns, so each request reads the prefix cached by the previous one and writes a
+    new entry for the next one. The breakpoint that just rolled out of the window is
+    cleared, which keeps the total within the API limit of four.
+    """
+    breakpoints_remaining = breakpoints
+    for message in reversed(messages):
+        if message["role"] != "user" or not isinstance(
+            content := message["content"], list
+        ):
+            continue
+        # rendered text blocks from the UI are not dicts, and never need a breakpoint
+        if not content or not isinstance(block := content[-1], dict):
+            continue
+        if breakpoints_remaining:
+            breakpoints_remaining -= 1
+            block["cache_control"] = _ephemeral()
+        else:
+            block.pop("cache_control", None)
+            break
 
 
 def _maybe_filter_to_n_most_recent_images(
@@ -284,6 +737,66 @@ def _maybe_filter_to_n_most_recent_images(
             tool_result["content"] = new_content
 
 
+class ImageIndex:
+    """
+    Incremental index of the tool_result images in a conversation, oldest first.
+
+    Equivalent to `_maybe_filter_to_n_most_recent_images`, but instead of rescanning
+    every message on every turn, images are registered as tool results are created,
+    so pruning costs O(images removed) rather than O(conversation length).
+    """
+
+    def __init__(self):
+        self._images: deque[tuple[BetaToolResultBlockParam, dict]] = deque()
+
+    @classmethod
+    def from_messages(cls, messages: Iterable[BetaMessageParam]) -> "ImageIndex":
+        index = cls()
+        for message in messages:
+            if isinstance(message["content"], list):
+                for item in message["content"]:
+                    if isinstance(item, dict) and item.get("type") == "tool_result":
+                        index.add(cast(BetaToolResultBlockParam, item))
+        return index
+
+    def __len__(self):
+        return len(self._images)
+
+    def add(self, tool_result: BetaToolResultBlockParam):
+        """Register the images of a tool_result appended after all indexed ones."""
+        content = tool_result.get("content")
+        if not isinstance(content, list):
+            return
+        for item in content:
+            if isinstance(item, dict) and item.get("type") == "image":
+                self._images.append((tool_result, item))
+
+    def discard(self, messages: Iterable[BetaMessageParam]):
+        """Forget the images of the oldest messages, which were dropped from the conversation."""
+        dropped = {
+            id(item)
+            for message in messages
+            if isinstance(message["content"], list)
+            for item in message["content"]
+        }
+        while self._images and id(self._images[0][0]) in dropped:
+            self._images.popleft()
+
+    def prune(self, images_to_keep: int, min_removal_threshold: int = 10) -> int:
+        """
+        Remove all but the final `images_to_keep` images in place, in chunks of
+        `min_removal_threshold` to reduce the amount we break the prompt cache.
+        Returns the number of images removed.
+        """
+        images_to_remove = len(self._images) - images_to_keep
+        images_to_remove -= images_to_remove % min_removal_threshold
+        for _ in range(max(images_to_remove, 0)):
+            tool_result, image = self._images.popleft()
+            content = cast(list, tool_result["content"])
+            del content[next(i for i, item in enumerate(content) if item is image)]
+        return max(images_to_remove, 0)
+
+
 def _make_api_tool_result(
     result: ToolResult, tool_use_id: str
 ) -> BetaToolResultBlockParam:
@@ -307,7 +820,7 @@ def _make_api_tool_result(
                     "type": "image",
                     "source": {
                         "type": "base64",
-                        "media_type": "image/png",
+                        "media_type": result.media_type or "image/png",
                         "data": result.base64_image,
                     },
                 }
@@ -6,11 +6,12 @@ import asyncio
 import base64
 import os
 import subprocess
+import sys
 from datetime import datetime
 from enum import StrEnum
 from functools import partial
 from pathlib import PosixPath
-from typing import cast
+from typing import Callable, cast
 
 import streamlit as st
 from anthropic import APIResponse
@@ -25,7 +26,10 @@ from loop import (
     PROVIDER_TO_DEFAULT_MODEL_NAME,
     APIProvider,
     sampling_loop,
+    sharded_sampling_loop,
 )
+from tools.clients import client_stats
+from tools.display import DisplayPool
 from tools.planner import get_plan_data
 from tools import ToolResult
 from dotenv import load_dotenv
@@ -92,6 +96,16 @@ def setup_state():
         st.session_state.custom_system_prompt = load_from_storage("system_prompt") or ""
     if "hide_images" not in st.session_state:
         st.session_state.hide_images = False
+    if "turn_stats" not in st.session_state:
+        st.session_state.turn_stats = []
+    if "context_token_budget" not in st.session_state:
+        st.session_state.context_token_budget = 0
+    if "workers" not in st.session_state:
+        st.session_state.workers = 1
+    if "stream" not in st.session_state:
+        st.session_state.stream = False
+    if "virtual_displays" not in st.session_state:
+        st.session_state.virtual_displays = False
 
 
 def _reset_model():
@@ -167,6 +181,30 @@ async def main():
             help="To decrease the total tokens sent, remove older screenshots from the conversation",
         )
 
+        st.number_input(
+            "Context token budget",
+            min_value=0,
+            step=10000,
+            key="context_token_budget",
+            help="Collapse finished test cases and drop the oldest tool calls once the conversation is estimated to exceed this many tokens (0 disables)",
+        )
+        if sys.platform.startswith("linux"):
+            st.checkbox(
+                "Virtual displays",
+                key="virtual_displays",
+                help="Run agents on their own Xvfb displays, which parallel workers require",
+            )
+        # agents sharing the one screen would interleave their clicks and keystrokes
+        if not st.session_state.virtual_displays:
+            st.session_state.workers = 1
+        st.number_input(
+            "Parallel workers",
+            min_value=1,
+            key="workers",
+            disabled=not st.session_state.virtual_displays,
+            help="Split the test plan across this many agents, each with its own conversation and virtual display (Linux only)",
+        )
+
         st.text_area(
             "Custom System Prompt Suffix",
             key="custom_system_prompt",
@@ -176,6 +214,25 @@ async def main():
             ),
         )
         st.checkbox("Hide screenshots", key="hide_images")
+        st.checkbox(
+            "Stream responses",
+            key="stream",
+            help="Show text as it is generated and start each tool as soon as its input is complete",
+        )
+
+        if st.session_state.turn_stats:
+            cache_reads = sum(t.cache_read_input_tokens for t in st.session_state.turn_stats)
+            cache_writes = sum(t.cache_creation_input_tokens for t in st.session_state.turn_stats)
+            st.caption(
+                f"Prompt cache over {len(st.session_state.turn_stats)} turns: "
+                f"{cache_reads} tokens read, {cache_writes} tokens written"
+            )
+        connections = client_stats().values()
+        if any(stats.requests for stats in connections):
+            st.caption(
+                f"API connections: {sum(stats.new_connections for stats in connections)} opened, "
+                f"{sum(stats.reused_connections for stats in connections)} reused"
+            )
 
         if st.button("Reset", type="primary"):
             with st.spinner("Resetting..."):
@@ -242,27 +299,70 @@ async def main():
             # we don't have a user message to respond to, exit early
             return
 
+        streaming_text = _StreamingText()
+        streaming_tools = _StreamingToolOutput(st.session_state.tools)
+        loop_kwargs = dict(
+            spreadsheet_id=st.session_state.spreadsheet_id,
+            system_prompt_suffix=st.session_state.custom_system_prompt,
+            model=st.session_state.model,
+            provider=st.session_state.provider,
+            output_callback=streaming_text.render_block,
+            stream=st.session_state.stream,
+            text_delta_callback=streaming_text.render_delta,
+            tool_output_callback=streaming_tools.render_result,
+            tool_stream_callback=streaming_tools.render_chunk,
+            api_response_callback=partial(
+                _api_response_callback,
+                tab=http_logs,
+                response_state=st.session_state.responses,
+            ),
+            api_key=st.session_state.api_key,
+            only_n_most_recent_images=st.session_state.only_n_most_recent_images,
+            only_n_most_recent_messages=st.session_state.only_n_most_recent_messages,
+            turn_stats_callback=st.session_state.turn_stats.append,
+            context_token_budget=st.session_state.context_token_budget or None,
+        )
+
         with st.spinner("Running Agent..."):
+            if (
+                st.session_state.workers > 1
+                and st.session_state.virtual_displays
+                and len(st.session_state.test_cases) > 1
+            ):
+                # each worker keeps its own conversation, only the summary is kept here
+                display_pool = DisplayPool()
+                try:
+                    conversations = await sharded_sampling_loop(
+                        test_cases=st.session_state.test_cases,
+                        workers=st.session_state.workers,
+                        display_pool=display_pool,
+                        start_message=new_message or "Start testing",
+                        # workers stream text at the same time, each into its own message;
+                        # tool output is already kept apart by tool_use ID
+                        worker_kwargs_factory=_worker_streaming_callbacks,
+                        **loop_kwargs,
+                    )
+                finally:
+                    if display_pool:
+                        await display_pool.close()
+                st.session_state.messages.append(
+                    {
+                        "role": Sender.BOT,
+                        "content": [
+                            BetaTextBlock(
+                                type="text",
+                                text=f"Test plan complete: {len(conversations)} test cases run by {st.session_state.workers} workers.",
+                            )
+                        ],
+                    }
+                )
+                return
+
             # run the agent sampling loop with the newest message
             st.session_state.messages = await sampling_loop(
-                spreadsheet_id=st.session_state.spreadsheet_id,
                 test_cases=st.session_state.test_cases,
-                system_prompt_suffix=st.session_state.custom_system_prompt,
-                model=st.session_state.model,
-                provider=st.session_state.provider,
                 messages=st.session_state.messages,
-                output_callback=partial(_render_message, Sender.BOT),
-                tool_output_callback=partial(
-                    _tool_output_callback, tool_state=st.session_state.tools
-                ),
-                api_response_callback=partial(
-                    _api_response_callback,
-                    tab=http_logs,
-                    response_state=st.session_state.responses,
-                ),
-                api_key=st.session_state.api_key,
-                only_n_most_recent_images=st.session_state.only_n_most_recent_images,
-                only_n_most_recent_messages=st.session_state.only_n_most_recent_messages,
+                **loop_kwargs,
             )
 
 
@@ -335,6 +435,62 @@ def _tool_output_callback(
     _render_message(Sender.TOOL, tool_output)
 
 
+class _StreamingText:
+    """Shows streamed text live until the finished block is rendered in its place."""
+
+    def __init__(self, label: str | None = None):
+        self._placeholder: DeltaGenerator | None = None
+        self._text = ""
+        self._label = label  # tells the live text of parallel workers apart
+
+    def render_delta(self, delta: str):
+        if self._placeholder is None:
+            self._placeholder = st.empty()
+        self._text += delta
+        text = f"**{self._label}:** {self._text}" if self._label else self._text
+        self._placeholder.chat_message(Sender.BOT).markdown(text)
+
+    def render_block(self, block: BetaTextBlock | BetaToolUseBlock):
+        if self._placeholder is not None:
+            self._placeholder.empty()
+            self._placeholder = None
+            self._text = ""
+        _render_message(Sender.BOT, block)
+
+
+def _worker_streaming_callbacks(worker_id: int) -> dict[str, Callable]:
+    streaming_text = _StreamingText(label=f"Worker {worker_id}")
+    return dict(
+        output_callback=streaming_text.render_block,
+        text_delta_callback=streaming_text.render_delta,
+    )
+
+
+class _StreamingToolOutput:
+    """Shows the output of running tools live until their result is rendered in its place."""
+
+    # only the end of a long output is kept on screen
+    max_chars = 8000
+
+    def __init__(self, tool_state: dict[str, ToolResult]):
+        self._tool_state = tool_state
+        self._placeholders: dict[str, DeltaGenerator] = {}
+        self._text: dict[str, str] = {}
+
+    def render_chunk(self, text: str, tool_id: str):
+        if tool_id not in self._placeholders:
+            self._placeholders[tool_id] = st.empty()
+        self._text[tool_id] = (self._text.get(tool_id, "") + text)[-self.max_chars :]
+        self._placeholders[tool_id].chat_message(Sender.TOOL).code(self._text[tool_id])
+
+    def render_result(self, tool_output: ToolResult, tool_id: str):
+        placeholder = self._placeholders.pop(tool_id, None)
+        if placeholder is not None:
+            placeholder.empty()
+            self._text.pop(tool_id, None)
+        _tool_output_callback(tool_output, tool_id, self._tool_state)
+
+
 def _render_api_response(
     response: APIResponse[BetaMessage], response_id: str, tab: DeltaGenerator
 ):
@@ -0,0 +1,43 @@
+import asyncio
+
+from tools.bash import BashTool, _BashSession
+
+
+def test_output_after_a_spilled_command_does_not_break_the_session(tmp_path):
+    async def scenario():
+        session = _BashSession(spill_dir=tmp_path)
+        session._timeout = 5
+        await session.start()
+        try:
+            # overflows the capture budget, and a background job writes after the sentinel
+            first = await session.run("seq 1 20000; { (sleep 0.2; seq 1 20000) & }")
+            await asyncio.sleep(0.5)
+            second = await session.run("echo ok")
+        finally:
+            await session.aclose()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert "full output in" in first.output
+    assert second.output == "ok"
+    (spilled,) = tmp_path.iterdir()
+    assert spilled.read_text().split() == [str(i) for i in range(1, 20001)]
+
+
+def test_close_waits_for_every_shell_of_the_tool():
+    async def scenario():
+        tool = BashTool()
+        await tool(command="echo one")
+        first = tool._session
+        # a recycled shell, one that ignores SIGTERM, and the warm ones of the pool
+        tool.end_test_case()
+        await tool(command="trap '' TERM; echo two")
+        stubborn = tool._session
+        sessions = [first, stubborn, *tool._pool._idle]
+        await tool.aclose()
+        return sessions
+
+    sessions = asyncio.run(scenario())
+    for session in sessions:
+        assert session._process.returncode is not None
+        assert all(reader.done() for reader in session._readers)
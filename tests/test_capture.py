@@ -0,0 +1,103 @@
+import pytest
+
+from tools.capture import OutputCapture
+
+
+def _stream(n: int) -> bytes:
+    return b"".join(b"%d\n" % i for i in range(n))
+
+
+def test_head_and_tail_are_kept_past_the_budget():
+    capture = OutputCapture(head_bytes=100, tail_bytes=50)
+    data = _stream(1000)
+    for start in range(0, len(data), 37):
+        capture.write(data[start : start + 37])
+
+    assert capture.total == len(data)
+    assert bytes(capture.head) == data[:100]
+    assert bytes(capture.tail) == data[-50:]
+    assert capture.dropped == len(data) - 150
+    text = capture.text()
+    assert text.startswith(data[:100].decode())
+    assert text.endswith(data[-50:].decode())
+    assert f"{len(data) - 150} bytes omitted" in text
+
+
+def test_everything_is_kept_within_the_budget():
+    capture = OutputCapture(head_bytes=100, tail_bytes=50)
+    capture.write(b"a" * 80)
+    capture.write(b"b" * 70)
+    assert capture.dropped == 0
+    assert capture.text() == "a" * 80 + "b" * 70
+
+
+def test_truncate_across_the_head_tail_boundary():
+    capture = OutputCapture(head_bytes=10, tail_bytes=10)
+    capture.write(b"0123456789abcdefghij")
+    # nothing was dropped, so the cut may fall inside the head
+    capture.truncate(5)
+    assert capture.text() == "01234"
+    assert capture.total == 5
+    capture.write(b"56789XYZ")
+    assert capture.text() == "0123456789XYZ"
+
+    capture = OutputCapture(head_bytes=10, tail_bytes=10)
+    capture.write(b"0123456789" + b"-" * 30 + b"abcdefghij")
+    capture.truncate(capture.total - 3)
+    assert bytes(capture.tail) == b"abcdefg"
+    with pytest.raises(ValueError):
+        capture.truncate(12)
+
+
+def test_last_finds_a_sentinel_split_across_chunks():
+    sentinel = b"<<exit>>"
+    capture = OutputCapture(head_bytes=4, tail_bytes=16)
+    chunks = [b"x" * 30 + b"<<ex", b"it>>\n"]
+    found = False
+    for chunk in chunks:
+        # how _BashSession._read searches each new chunk
+        window = capture.last(len(sentinel) - 1) + chunk
+        capture.write(chunk)
+        found = found or sentinel in window
+    assert found
+    assert capture.rfind(sentinel) == 30
+    assert capture.last(3) == b">>\n"
+
+
+def test_last_reaches_into_the_head_while_nothing_is_dropped():
+    capture = OutputCapture(head_bytes=8, tail_bytes=8)
+    capture.write(b"abcdefgh12")
+    assert capture.last(5) == b"fgh12"
+
+
+def test_spill_file_holds_the_full_stream(tmp_path):
+    spill = tmp_path / "out.log"
+    capture = OutputCapture(head_bytes=64, tail_bytes=64, spill_path=spill)
+    data = _stream(5000)
+    for start in range(0, len(data), 1000):
+        capture.write(data[start : start + 1000])
+    assert capture.spilled
+    assert str(spill) in capture.text()
+
+    capture.truncate(len(data) - 5)
+    capture.close()
+    assert spill.read_bytes() == data[:-5]
+    # output after close is still captured, just not spilled
+    capture.write(b"late\n")
+    assert capture.text().endswith("late\n")
+    assert spill.read_bytes() == data[:-5]
+
+
+def test_small_streams_are_not_spilled(tmp_path):
+    spill = tmp_path / "out.log"
+    capture = OutputCapture(head_bytes=64, tail_bytes=64, spill_path=spill)
+    capture.write(b"short")
+    capture.close()
+    assert not capture.spilled
+    assert not spill.exists()
+
+
+def test_clipped_text_keeps_the_search_advice():
+    capture = OutputCapture(head_bytes=10, tail_bytes=10)
+    capture.write(_stream(100))
+    assert "`grep -n`" in capture.text()
@@ -0,0 +1,86 @@
+import random
+
+from compaction import SUMMARY_MARKER, ContextCompactor, drop_oldest_exchanges
+
+
+def _exchange(i: int, tools: int = 1) -> list[dict]:
+    uses = [
+        {"type": "tool_use", "id": f"t{i}_{j}", "name": "bash", "input": {"command": "x" * 200}}
+        for j in range(tools)
+    ]
+    results = [
+        {"type": "tool_result", "tool_use_id": use["id"], "content": "y" * 200} for use in uses
+    ]
+    return [
+        {"role": "assistant", "content": [{"type": "text", "text": f"step {i}"}, *uses]},
+        {"role": "user", "content": results},
+    ]
+
+
+def _summary(i: int) -> list[dict]:
+    return [
+        {"role": "assistant", "content": [{"type": "text", "text": f"{SUMMARY_MARKER} {i}>"}]},
+        {"role": "user", "content": [{"type": "text", "text": "Continue."}]},
+    ]
+
+
+def _conversation(rng: random.Random, exchanges: int, summaries: int = 0) -> list[dict]:
+    messages = [{"role": "user", "content": "Start testing"}]
+    for i in range(summaries):
+        messages += _summary(i)
+    for i in range(exchanges):
+        messages += _exchange(i, tools=rng.randint(1, 3))
+    return messages
+
+
+def _assert_intact(original: list[dict], messages: list[dict]):
+    assert messages[0] is original[0]
+    assert messages[-2:] == original[-2:]
+    for index, message in enumerate(messages):
+        if message["role"] != "assistant":
+            continue
+        uses = {block["id"] for block in message["content"] if block["type"] == "tool_use"}
+        if uses:
+            reply = messages[index + 1]["content"]
+            assert uses == {block["tool_use_id"] for block in reply if block["type"] == "tool_result"}
+    for index, message in enumerate(messages[1:], start=1):
+        for block in message["content"] if isinstance(message["content"], list) else []:
+            if block["type"] == "tool_result":
+                previous = messages[index - 1]["content"]
+                assert block["tool_use_id"] in {b.get("id") for b in previous}
+
+
+def test_tool_use_and_result_are_never_separated():
+    rng = random.Random(7)
+    for _ in range(300):
+        original = _conversation(rng, rng.randint(0, 30), summaries=rng.randint(0, 3))
+        messages = list(original)
+        keep = rng.randint(0, len(messages) + 2)
+        removed = drop_oldest_exchanges(
+            messages, keep, min_removal=rng.randint(0, 12), keep_summaries=rng.random() < 0.5
+        )
+        _assert_intact(original, messages)
+        assert len(messages) + len(removed) == len(original)
+        assert len(removed) % 2 == 0
+
+
+def test_summaries_are_kept_when_asked():
+    rng = random.Random(3)
+    original = _conversation(rng, 20, summaries=3)
+    messages = list(original)
+    drop_oldest_exchanges(messages, 10, keep_summaries=True)
+    assert messages[1:7] == original[1:7]
+    _assert_intact(original, messages)
+
+
+def test_compaction_keeps_the_invariant():
+    rng = random.Random(11)
+    for _ in range(50):
+        original = _conversation(rng, rng.randint(5, 60))
+        messages = list(original)
+        compactor = ContextCompactor(token_budget=rng.randint(500, 5000))
+        compactor.observe(*messages)
+        removed = compactor.maybe_compact(messages)
+        _assert_intact(original, messages)
+        if removed:
+            assert len(removed) >= compactor.min_removal or len(messages) <= 3
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from tools.base import ToolError
+from tools.edit import EditTool
+from tools.edit_history import EditHistory
+
+
+def _run(tool: EditTool, **kwargs):
+    return asyncio.run(tool(**kwargs))
+
+
+def test_undo_restores_every_edit_in_reverse_order(tmp_path):
+    path = tmp_path / "notes.txt"
+    tool = EditTool()
+    text = "\n".join(f"line {i}" for i in range(200))
+    _run(tool, command="create", path=str(path), file_text=text)
+    # what the previous implementation kept: the text before each edit, create included
+    expected = [text]
+    for i in range(0, 200, 20):
+        expected.append(path.read_text())
+        _run(tool, command="str_replace", path=str(path), old_str=f"line {i}\n", new_str=f"LINE {i}\n" * 3)
+        expected.append(path.read_text())
+        _run(tool, command="insert", path=str(path), insert_line=i, new_str="x" * 1000)
+
+    while expected:
+        _run(tool, command="undo_edit", path=str(path))
+        assert path.read_text() == expected.pop()
+
+
+def test_undo_without_history_raises_the_same_error(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("untouched")
+    tool = EditTool()
+    with pytest.raises(ToolError) as error:
+        _run(tool, command="undo_edit", path=str(path))
+    assert error.value.message == f"No edit history found for {path}."
+
+    _run(tool, command="str_replace", path=str(path), old_str="untouched", new_str="edited")
+    _run(tool, command="undo_edit", path=str(path))
+    assert path.read_text() == "untouched"
+    with pytest.raises(ToolError, match="No edit history found"):
+        _run(tool, command="undo_edit", path=str(path))
+
+
+def test_history_past_the_byte_bound_keeps_the_newest_restore_points(tmp_path):
+    history = EditHistory(max_file_bytes=64 * 1024, compress=False)
+    path = tmp_path / "big.txt"
+    # every version differs everywhere, so each restore point costs a whole copy
+    versions = [str(i) * 10_000 for i in range(10)]
+    for text in versions:
+        history.push(path, text)
+    assert history.size <= history.max_file_bytes
+
+    restored = []
+    while (text := history.pop(path)) is not None:
+        restored.append(text)
+    assert 0 < len(restored) < len(versions)
+    assert restored == versions[::-1][: len(restored)]
+    assert path not in history
+    assert history.size == 0
+
+
+def test_global_bound_evicts_the_least_recently_edited_file(tmp_path):
+    history = EditHistory(max_bytes=64 * 1024, compress=False)
+    old, new = tmp_path / "old.txt", tmp_path / "new.txt"
+    history.push(old, "a" * 20_000)
+    history.push(new, "b" * 20_000)
+    history.push(new, "c" * 20_000)
+    history.push(new, "d" * 20_000)
+    assert old not in history
+    assert history.pop(new) == "d" * 20_000
@@ -0,0 +1,37 @@
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("PIL")
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_evidence_in_memory_is_spilled_at_exit(tmp_path):
+    # the frames never leave the in-memory ring, so only the atexit flush writes them
+    script = textwrap.dedent(
+        f"""
+        from PIL import Image
+
+        from tools.screen import Frame
+        from tools.screenshot_store import get_store
+
+        store = get_store({str(tmp_path)!r})
+        for label in ("TC-1", "TC-2"):
+            store.put("worker_0", Frame(width=8, height=8, image=Image.new("RGB", (8, 8))))
+            store.mark_evidence("worker_0", label)
+        """
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+    assert "RuntimeError" not in result.stderr
+
+    spilled = sorted(path.name for path in (tmp_path / "evidence" / "worker_0").iterdir())
+    assert len(spilled) == 2
+    assert spilled[0].endswith("_TC-1.webp") or spilled[0].endswith("_TC-1.png")
+    assert spilled[1].endswith("_TC-2.webp") or spilled[1].endswith("_TC-2.png")
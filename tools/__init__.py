@@ -3,11 +3,15 @@ from .bash import BashTool
 from .collection import ToolCollection
 from .computer import ComputerTool
 from .edit import EditTool
+from .macro import ComputerMacroTool
 from .record_result import RecordTestResultTool
+from .zoom import ComputerZoomTool
 __ALL__ = [
     BashTool,
     CLIResult,
+    ComputerMacroTool,
     ComputerTool,
+    ComputerZoomTool,
     EditTool,
     RecordTestResultTool,
     ToolCollection,
@@ -1,6 +1,6 @@
 from abc import ABCMeta, abstractmethod
 from dataclasses import dataclass, fields, replace
-from typing import Any
+from typing import Any, ClassVar
 
 from anthropic.types.beta import BetaToolUnionParam
 
@@ -8,6 +8,28 @@ from anthropic.types.beta import BetaToolUnionParam
 class BaseAnthropicTool(metaclass=ABCMeta):
     """Abstract base class for Anthropic-defined tools."""
 
+    # tools that only have side effects outside the screen and shell (e.g. writing
+    # results to a remote service) may overlap with the other tool calls of a turn
+    parallel_safe: ClassVar[bool] = False
+    # tools that accept an `on_output` callback for partial output while they run
+    streams_output: ClassVar[bool] = False
+
+    def forget_sent_images(self):
+        """Called when no screenshot sent by this tool remains in the conversation."""
+
+    def prefetch(self):
+        """Called while the model is thinking, to prepare a likely next call in the background."""
+
+    def end_test_case(self):
+        """Called once a test case is recorded, to drop state that must not leak into the next."""
+
+    def close(self):
+        """Called when the tools are no longer needed, to release processes they hold."""
+
+    async def aclose(self):
+        """close() for async callers, which also waits for those processes to exit."""
+        self.close()
+
     @abstractmethod
     def __call__(self, **kwargs) -> Any:
         """Executes the tool with the given arguments."""
@@ -27,6 +49,7 @@ class ToolResult:
     output: str | None = None
     error: str | None = None
     base64_image: str | None = None
+    media_type: str | None = None  # of base64_image, PNG when unset
     system: str | None = None
 
     def __bool__(self):
@@ -46,6 +69,7 @@ class ToolResult:
             output=combine_fields(self.output, other.output),
             error=combine_fields(self.error, other.error),
             base64_image=combine_fields(self.base64_image, other.base64_image, False),
+            media_type=self.media_type or other.media_type,
             system=combine_fields(self.system, other.system),
         )
 
@@ -1,10 +1,24 @@
 import asyncio
+import contextlib
 import os
-from typing import ClassVar, Literal
+import signal
+from pathlib import Path
+from typing import Callable, ClassVar, Literal
+from uuid import uuid4
 
 from anthropic.types.beta import BetaToolBash20241022Param
 
 from .base import BaseAnthropicTool, CLIResult, ToolError, ToolResult
+from .capture import OutputCapture
+from .tracing import span
+
+# when set, stdout that overflows the capture budget is kept there in full
+SPILL_DIR = os.getenv("BASH_OUTPUT_SPILL_DIR")
+# output streamed while a command runs: at most one push per interval, of the latest bytes
+STREAM_INTERVAL = 0.5  # seconds
+STREAM_MAX_BYTES = 4096
+# started shells kept ready for each BashTool
+WARM_SESSIONS = int(os.getenv("BASH_WARM_SESSIONS", "1"))
 
 
 class _BashSession:
@@ -14,13 +28,28 @@ class _BashSession:
     _process: asyncio.subprocess.Process
 
     command: str = "/bin/bash"
-    _output_delay: float = 0.2  # seconds
     _timeout: float = 120.0  # seconds
+    # stderr is a separate pipe and may trail stdout by a few ms
+    _stderr_grace: float = 0.1  # seconds
+    _read_size: int = 2**16
+    # SIGTERM is followed by SIGKILL if the shell has not exited after this long
+    _stop_timeout: float = 1.0  # seconds
     _sentinel: str = "<<exit>>"
 
-    def __init__(self):
+    def __init__(self, env: dict[str, str] | None = None, spill_dir: str | Path | None = SPILL_DIR):
         self._started = False
         self._timed_out = False
+        self._env = env
+        self._spill_dir = Path(spill_dir) if spill_dir else None
+        # only the head and tail of each command's output are kept in memory
+        self._stdout = OutputCapture()
+        self._stderr = OutputCapture()
+        # set when the sentinel was read from the stream, or at EOF
+        self._stdout_done = asyncio.Event()
+        self._stderr_done = asyncio.Event()
+        # output not yet streamed, while a command with on_output runs
+        self._pending: bytearray | None = None
+        self._readers: list[asyncio.Task] = []
 
     async def start(self):
         if self._started:
@@ -34,20 +63,76 @@ class _BashSession:
             stdin=asyncio.subprocess.PIPE,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
+            env=self._env,
         )
+        assert self._process.stdout
+        assert self._process.stderr
+        self._readers = [
+            asyncio.create_task(self._read(self._process.stdout, self._stdout, self._stdout_done)),
+            asyncio.create_task(self._read(self._process.stderr, self._stderr, self._stderr_done)),
+        ]
 
         self._started = True
 
+    @property
+    def alive(self) -> bool:
+        return self._started and self._process.returncode is None
+
+    async def _read(self, stream: asyncio.StreamReader, capture: OutputCapture, done: asyncio.Event):
+        """Drain a pipe into `capture`, setting `done` as soon as the sentinel arrives."""
+        sentinel = self._sentinel.encode()
+        while chunk := await stream.read(self._read_size):
+            # only the new bytes, plus a sentinel split across chunks, are searched
+            window = capture.last(len(sentinel) - 1) + chunk
+            capture.write(chunk)
+            if self._pending is not None:
+                self._pending += chunk
+                del self._pending[:-STREAM_MAX_BYTES]
+            if not done.is_set() and sentinel in window:
+                done.set()
+        done.set()
+
     def stop(self):
         """Terminate the bash shell."""
         if not self._started:
             raise ToolError("Session has not started.")
         if self._process.returncode is not None:
             return
-        self._process.terminate()
+        # bash runs under /bin/sh in its own session, terminate both so the pipes close
+        try:
+            os.killpg(self._process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
 
-    async def run(self, command: str):
-        """Execute a command in the bash shell."""
+    async def aclose(self):
+        """Terminate the bash shell and wait for it and its pipe readers to finish."""
+        if not self._started:
+            return
+        self.stop()
+        # the transport of the process is only released once every pipe is closed
+        assert self._process.stdin
+        self._process.stdin.close()
+        try:
+            async with asyncio.timeout(self._stop_timeout):
+                await self._process.wait()
+                # the pipes reach EOF once every process of the session has exited
+                await asyncio.gather(*self._readers)
+        except asyncio.TimeoutError:
+            with contextlib.suppress(ProcessLookupError):
+                os.killpg(self._process.pid, signal.SIGKILL)
+            for reader in self._readers:
+                reader.cancel()
+            await self._process.wait()
+            await asyncio.gather(*self._readers, return_exceptions=True)
+
+    def _flush_stream(self, on_output: Callable[[str], None]):
+        if self._pending:
+            text = self._pending.decode(errors="replace")
+            self._pending.clear()
+            on_output(text)
+
+    async def run(self, command: str, on_output: Callable[[str], None] | None = None):
+        """Execute a command in the bash shell, streaming its output to `on_output` if given."""
         if not self._started:
             raise ToolError("Session has not started.")
         if self._process.returncode is not None:
@@ -60,49 +145,155 @@ class _BashSession:
                 f"timed out: bash has not returned in {self._timeout} seconds and must be restarted",
             )
 
-        # we know these are not None because we created the process with PIPEs
+        # we know this is not None because we created the process with PIPEs
         assert self._process.stdin
-        assert self._process.stdout
-        assert self._process.stderr
 
-        # send command to the process
+        # output between commands (e.g. from background jobs) is dropped, as before
+        spill_path = None
+        if self._spill_dir:
+            spill_path = self._spill_dir / f"bash_{uuid4().hex}.log"
+        self._stdout.clear(spill_path)
+        self._stderr.clear()
+        self._stdout_done.clear()
+        self._stderr_done.clear()
+        self._pending = bytearray() if on_output else None
+
+        # send command to the process, followed by a sentinel on each stream
         self._process.stdin.write(
-            command.encode() + f"; echo '{self._sentinel}'\n".encode()
+            command.encode()
+            + f"; echo '{self._sentinel}'; echo '{self._sentinel}' >&2\n".encode()
         )
         await self._process.stdin.drain()
 
-        # read output from the process, until the sentinel is found
+        # the reader tasks wake us up as soon as the sentinel is read
         try:
             async with asyncio.timeout(self._timeout):
                 while True:
-                    await asyncio.sleep(self._output_delay)
-                    # if we read directly from stdout/stderr, it will wait forever for
-                    # EOF. use the StreamReader buffer directly instead.
-                    output = self._process.stdout._buffer.decode()  # pyright: ignore[reportAttributeAccessIssue]
-                    if self._sentinel in output:
-                        # strip the sentinel and break
-                        output = output[: output.index(self._sentinel)]
+                    try:
+                        await asyncio.wait_for(
+                            self._stdout_done.wait(), STREAM_INTERVAL if on_output else None
+                        )
                         break
+                    except asyncio.TimeoutError:
+                        self._flush_stream(on_output)
         except asyncio.TimeoutError:
             self._timed_out = True
             raise ToolError(
                 f"timed out: bash has not returned in {self._timeout} seconds and must be restarted",
             ) from None
+        finally:
+            # the rest, including the sentinel, is only in the result
+            self._pending = None
+
+        end = self._stdout.rfind(self._sentinel.encode())
+        if end == -1:
+            return ToolResult(
+                system="tool must be restarted",
+                error=f"bash has exited with returncode {await self._process.wait()}",
+            )
+        self._stdout.truncate(end)
+        output = self._stdout.text()
+        self._stdout.close()
+
+        # a command that redirected the shell's stderr never sends the stderr sentinel
+        try:
+            async with asyncio.timeout(self._stderr_grace):
+                await self._stderr_done.wait()
+        except asyncio.TimeoutError:
+            pass
 
         if output.endswith("\n"):
             output = output[:-1]
 
-        error = self._process.stderr._buffer.decode()  # pyright: ignore[reportAttributeAccessIssue]
+        error = self._stderr.text().replace(f"{self._sentinel}\n", "")
         if error.endswith("\n"):
             error = error[:-1]
 
-        # clear the buffers so that the next output can be read correctly
-        self._process.stdout._buffer.clear()  # pyright: ignore[reportAttributeAccessIssue]
-        self._process.stderr._buffer.clear()  # pyright: ignore[reportAttributeAccessIssue]
-
         return CLIResult(output=output, error=error)
 
 
+class BashSessionPool:
+    """
+    Keeps `size` started shells ready, so that leasing a session never waits for bash to
+    spawn. Used sessions are not reused: each lease is a fresh shell, and a recycled one
+    is terminated and replaced in the background.
+    """
+
+    def __init__(
+        self,
+        size: int = WARM_SESSIONS,
+        env: dict[str, str] | None = None,
+        spill_dir: str | Path | None = SPILL_DIR,
+    ):
+        self.size = size
+        self.env = env
+        self.spill_dir = spill_dir
+        self._idle: list[_BashSession] = []
+        self._filling: asyncio.Task | None = None
+        # sessions being terminated, awaited by aclose()
+        self._closing: set[asyncio.Task] = set()
+
+    def fill(self):
+        """Start shells in the background until `size` are ready; needs a running event loop."""
+        if self._filling is None or self._filling.done():
+            self._filling = asyncio.create_task(self._fill())
+
+    async def _fill(self):
+        while len(self._idle) < self.size:
+            session = _BashSession(self.env, self.spill_dir)
+            starting = asyncio.ensure_future(session.start())
+            try:
+                await asyncio.shield(starting)
+            except asyncio.CancelledError:
+                # cancelled by close(): the shell may be spawned already, stop it once it is
+                with contextlib.suppress(Exception):
+                    await starting
+                self.retire(session)
+                raise
+            self._idle.append(session)
+
+    async def lease(self) -> _BashSession:
+        # shells killed from outside are dropped
+        self._idle = [session for session in self._idle if session.alive]
+        with span("bash.lease", warm=bool(self._idle)):
+            if self._idle:
+                session = self._idle.pop(0)
+            else:
+                session = _BashSession(self.env, self.spill_dir)
+                await session.start()
+        self.fill()
+        return session
+
+    def retire(self, session: _BashSession):
+        """Terminate a session in the background; aclose() waits for it to finish."""
+        task = asyncio.create_task(session.aclose())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    def recycle(self, session: _BashSession):
+        """Terminate a used session; its replacement is started in the background."""
+        self.retire(session)
+        self.fill()
+
+    def close(self):
+        if self._filling is not None:
+            self._filling.cancel()
+        for session in self._idle:
+            if session.alive:
+                session.stop()
+        self._idle.clear()
+
+    async def aclose(self):
+        """Terminate every session of the pool and wait until they are gone."""
+        if self._filling is not None:
+            self._filling.cancel()
+            await asyncio.gather(self._filling, return_exceptions=True)
+        for session in self._idle:
+            self.retire(session)
+        self._idle.clear()
+        await asyncio.gather(*self._closing)
+
+
 class BashTool(BaseAnthropicTool):
     """
     A tool that allows the agent to run bash commands.
@@ -111,29 +302,56 @@ class BashTool(BaseAnthropicTool):
 
     _session: _BashSession | None
     name: ClassVar[Literal["bash"]] = "bash"
+    streams_output = True
     api_type: ClassVar[Literal["bash_20241022"]] = "bash_20241022"
 
-    def __init__(self):
+    def __init__(self, env: dict[str, str] | None = None, pool: BashSessionPool | None = None):
         self._session = None
+        # e.g. DISPLAY, so that commands open windows on the agent's own Xvfb display
+        self._pool = pool or BashSessionPool(env=env)
         super().__init__()
 
+    def prefetch(self):
+        # warm up shells while the model is thinking
+        self._pool.fill()
+
+    def end_test_case(self):
+        # the next test case gets a fresh shell, without the environment of this one
+        if self._session:
+            self._pool.recycle(self._session)
+            self._session = None
+
+    def close(self):
+        if self._session:
+            self._session.stop()
+            self._session = None
+        self._pool.close()
+
+    async def aclose(self):
+        if self._session:
+            self._pool.retire(self._session)
+            self._session = None
+        await self._pool.aclose()
+
     async def __call__(
-        self, command: str | None = None, restart: bool = False, **kwargs
+        self,
+        command: str | None = None,
+        restart: bool = False,
+        on_output: Callable[[str], None] | None = None,
+        **kwargs,
     ):
         if restart:
             if self._session:
-                self._session.stop()
-            self._session = _BashSession()
-            await self._session.start()
+                self._pool.recycle(self._session)
+            self._session = await self._pool.lease()
 
             return ToolResult(system="tool has been restarted.")
 
         if self._session is None:
-            self._session = _BashSession()
-            await self._session.start()
+            self._session = await self._pool.lease()
 
         if command is not None:
-            return await self._session.run(command)
+            return await self._session.run(command, on_output)
 
         raise ToolError("no command provided.")
 
@@ -0,0 +1,132 @@
+"""
+Bounded capture of command output.
+
+`OutputCapture` keeps the first `head_bytes` and the last `tail_bytes` of a stream and
+only counts what falls in between, so a runaway command cannot exhaust memory. Given a
+`spill_path`, the full stream is also written there once it overflows the budget, and
+the clipped text points to the file.
+"""
+
+import asyncio
+import os
+from pathlib import Path
+
+HEAD_BYTES = int(os.getenv("OUTPUT_HEAD_KB", "8")) * 1024
+TAIL_BYTES = int(os.getenv("OUTPUT_TAIL_KB", "8")) * 1024
+READ_SIZE = 2**16
+
+CLIPPED_NOTE = "<NOTE>To save on context only part of this file has been shown to you. You should retry this tool after you have searched inside the file with `grep -n` in order to find the line numbers of what you are looking for.</NOTE>"
+CLIPPED_NOTICE = "\n<response clipped: {dropped} bytes omitted{spilled}>" + CLIPPED_NOTE + "\n"
+
+
+class OutputCapture:
+    """Head and tail of a byte stream within a fixed memory budget; None keeps everything."""
+
+    def __init__(
+        self,
+        head_bytes: int | None = HEAD_BYTES,
+        tail_bytes: int = TAIL_BYTES,
+        spill_path: str | Path | None = None,
+    ):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.spill_path = Path(spill_path) if spill_path else None
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0  # bytes written since the last clear
+        self._spill = None
+
+    @property
+    def dropped(self) -> int:
+        return self.total - len(self.head) - len(self.tail)
+
+    @property
+    def spilled(self) -> bool:
+        return self._spill is not None
+
+    def write(self, chunk: bytes):
+        self.total += len(chunk)
+        # output after close(), e.g. from a background job, is no longer spilled
+        if self._spill is not None and not self._spill.closed:
+            self._spill.write(chunk)
+        if self.head_bytes is None:
+            self.head += chunk
+            return
+        room = self.head_bytes - len(self.head)
+        if room > 0:
+            self.head += chunk[:room]
+            chunk = chunk[room:]
+        self.tail += chunk
+        overflow = len(self.tail) - self.tail_bytes
+        if overflow > 0:
+            if self._spill is None and self.spill_path is not None:
+                self._open_spill()
+            # deleting from the front of a bytearray is amortised O(1)
+            del self.tail[:overflow]
+
+    def _open_spill(self):
+        self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+        self._spill = open(self.spill_path, "wb")
+        # nothing has been dropped yet, so head and tail are the whole stream so far
+        self._spill.write(self.head)
+        self._spill.write(self.tail)
+
+    def last(self, n: int) -> bytes:
+        """The last `n` bytes of the stream, or fewer if they are no longer in memory."""
+        if len(self.tail) >= n or self.dropped:
+            return bytes(self.tail[-n:]) if n else b""
+        return bytes(self.head[len(self.head) - (n - len(self.tail)) :]) + bytes(self.tail)
+
+    def rfind(self, sub: bytes) -> int:
+        """Stream offset of the last occurrence of `sub` still in memory, or -1."""
+        found = self.tail.rfind(sub)
+        if found != -1:
+            return self.total - len(self.tail) + found
+        if self.dropped:
+            return -1
+        return (self.head + self.tail).rfind(sub)
+
+    def truncate(self, size: int):
+        """Cut the stream at offset `size`, e.g. to remove a trailing sentinel."""
+        tail_start = self.total - len(self.tail)
+        if size >= tail_start:
+            del self.tail[size - tail_start :]
+        elif self.dropped == 0:
+            del self.head[size:]
+            self.tail.clear()
+        else:
+            raise ValueError(f"offset {size} has already been dropped")
+        self.total = size
+        if self._spill is not None:
+            self._spill.flush()
+            self._spill.truncate(size)
+            self._spill.seek(size)
+
+    def text(self) -> str:
+        """The captured output, with a notice where bytes were dropped."""
+        if not self.dropped:
+            return (self.head + self.tail).decode(errors="replace")
+        spilled = f", full output in {self.spill_path}" if self._spill is not None else ""
+        return (
+            self.head.decode(errors="replace")
+            + CLIPPED_NOTICE.format(dropped=self.dropped, spilled=spilled)
+            + self.tail.decode(errors="replace")
+        )
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+
+    def clear(self, spill_path: str | Path | None = None):
+        """Start capturing a new stream, spilling to `spill_path` if it overflows."""
+        self.close()
+        self._spill = None
+        self.spill_path = Path(spill_path) if spill_path else None
+        self.head.clear()
+        self.tail.clear()
+        self.total = 0
+
+    async def read_from(self, stream: asyncio.StreamReader):
+        """Capture `stream` until EOF."""
+        while chunk := await stream.read(READ_SIZE):
+            self.write(chunk)
@@ -0,0 +1,143 @@
+"""Process-wide registry of pooled Anthropic API clients."""
+
+import hashlib
+import importlib.util
+import os
+import threading
+import weakref
+from dataclasses import dataclass, field
+
+import httpx
+from anthropic import Anthropic, AnthropicBedrock, AnthropicVertex, DefaultHttpxClient
+
+POOL_MAX_CONNECTIONS: int = 20
+POOL_MAX_KEEPALIVE_CONNECTIONS: int = 10
+POOL_KEEPALIVE_EXPIRY: float = 120.0  # seconds
+# HTTP/2 needs the optional `h2` package (pip install httpx[http2])
+HTTP2_ENABLED: bool = os.getenv("API_HTTP2", "0") == "1"
+
+Client = Anthropic | AnthropicBedrock | AnthropicVertex
+
+
+@dataclass
+class ConnectionStats:
+    """Request and connection counters for one pooled client."""
+
+    requests: int = 0
+    new_connections: int = 0
+    reused_connections: int = 0
+    # weak, so a closed connection's stream is forgotten rather than its id reused
+    _seen_streams: weakref.WeakSet = field(default_factory=weakref.WeakSet, repr=False)
+
+    def observe(self, response: httpx.Response):
+        self.requests += 1
+        stream = response.extensions.get("network_stream")
+        if stream is None:
+            return
+        if stream in self._seen_streams:
+            self.reused_connections += 1
+        else:
+            self._seen_streams.add(stream)
+            self.new_connections += 1
+
+
+def _fingerprint(*parts: str | None) -> str:
+    """Hash credentials so that registry keys never hold secrets in the clear."""
+    digest = hashlib.sha256("\0".join(part or "" for part in parts).encode())
+    return digest.hexdigest()[:12]
+
+
+def _credentials_fingerprint(provider: str, api_key: str | None) -> str:
+    if provider == "anthropic":
+        return _fingerprint(api_key)
+    if provider == "bedrock":
+        return _fingerprint(
+            os.getenv("AWS_REGION"),
+            os.getenv("AWS_PROFILE"),
+            os.getenv("AWS_ACCESS_KEY_ID"),
+        )
+    if provider == "vertex":
+        return _fingerprint(
+            os.getenv("CLOUD_ML_REGION"), os.getenv("ANTHROPIC_VERTEX_PROJECT_ID")
+        )
+    raise ValueError(f"Unknown API provider: {provider}")
+
+
+class ClientRegistry:
+    """
+    Hands out one long-lived client per (provider, credentials) pair, each backed by
+    a keep-alive connection pool, so TLS sessions survive across turns and runs.
+    """
+
+    def __init__(self, http2: bool = HTTP2_ENABLED):
+        self._http2 = http2 and importlib.util.find_spec("h2") is not None
+        self._lock = threading.Lock()
+        self._clients: dict[tuple[str, str, str | None], Client] = {}
+        self._stats: dict[tuple[str, str, str | None], ConnectionStats] = {}
+
+    def get(
+        self, provider: str, api_key: str | None = None, base_url: str | None = None
+    ) -> Client:
+        key = (str(provider), _credentials_fingerprint(provider, api_key), base_url)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                stats = self._stats[key] = ConnectionStats()
+                client = self._clients[key] = self._create(
+                    provider, api_key, base_url, stats
+                )
+            return client
+
+    def _create(
+        self,
+        provider: str,
+        api_key: str | None,
+        base_url: str | None,
+        stats: ConnectionStats,
+    ) -> Client:
+        http_client = DefaultHttpxClient(
+            http2=self._http2,
+            limits=httpx.Limits(
+                max_connections=POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=POOL_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+            ),
+            event_hooks={"response": [stats.observe]},
+        )
+        if provider == "anthropic":
+            return Anthropic(api_key=api_key, base_url=base_url, http_client=http_client)
+        if provider == "vertex":
+            return AnthropicVertex(base_url=base_url, http_client=http_client)
+        if provider == "bedrock":
+            return AnthropicBedrock(base_url=base_url, http_client=http_client)
+        raise ValueError(f"Unknown API provider: {provider}")
+
+    def stats(self) -> dict[str, ConnectionStats]:
+        """Connection counters keyed by `provider:fingerprint`."""
+        with self._lock:
+            return {
+                f"{provider}:{fingerprint}": stats
+                for (provider, fingerprint, _), stats in self._stats.items()
+            }
+
+    def close(self):
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+            self._stats.clear()
+
+
+_registry = ClientRegistry()
+
+
+def get_client(
+    provider: str, api_key: str | None = None, base_url: str | None = None
+) -> Client:
+    """Return the shared pooled client for the given provider and credentials."""
+    return _registry.get(provider, api_key=api_key, base_url=base_url)
+
+
+def client_stats() -> dict[str, ConnectionStats]:
+    """Return connection reuse counters for every client created so far."""
+    return _registry.stats()
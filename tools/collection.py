@@ -1,6 +1,6 @@
 """Collection classes for managing multiple tools."""
 
-from typing import Any
+from typing import Any, Callable
 
 from anthropic.types.beta import BetaToolUnionParam
 
@@ -10,6 +10,7 @@ from .base import (
     ToolFailure,
     ToolResult,
 )
+from .tracing import span
 
 
 class ToolCollection:
@@ -24,11 +25,45 @@ class ToolCollection:
     ) -> list[BetaToolUnionParam]:
         return [tool.to_params() for tool in self.tools]
 
-    async def run(self, *, name: str, tool_input: dict[str, Any]) -> ToolResult:
+    def is_parallel_safe(self, name: str) -> bool:
+        tool = self.tool_map.get(name)
+        return tool is not None and tool.parallel_safe
+
+    def forget_sent_images(self):
+        for tool in self.tools:
+            tool.forget_sent_images()
+
+    def prefetch(self):
+        for tool in self.tools:
+            tool.prefetch()
+
+    def end_test_case(self):
+        for tool in self.tools:
+            tool.end_test_case()
+
+    def close(self):
+        for tool in self.tools:
+            tool.close()
+
+    async def aclose(self):
+        for tool in self.tools:
+            await tool.aclose()
+
+    async def run(
+        self,
+        *,
+        name: str,
+        tool_input: dict[str, Any],
+        on_output: Callable[[str], None] | None = None,
+    ) -> ToolResult:
         tool = self.tool_map.get(name)
         if not tool:
             return ToolFailure(error=f"Tool {name} is invalid")
-        try:
-            return await tool(**tool_input)
-        except ToolError as e:
-            return ToolFailure(error=e.message)
+        with span("tool.run", tool=name, action=tool_input.get("action")) as tool_span:
+            try:
+                if on_output and tool.streams_output:
+                    return await tool(**tool_input, on_output=on_output)
+                return await tool(**tool_input)
+            except ToolError as e:
+                tool_span.attributes["error"] = True
+                return ToolFailure(error=e.message)
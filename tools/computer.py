@@ -1,23 +1,35 @@
 import asyncio
 import base64
 import os
-import shlex
-import pyautogui
-import keyboard
+import time
+from collections import defaultdict
+from dataclasses import dataclass
 from enum import StrEnum
 from pathlib import Path
 from typing import Literal, TypedDict
-from uuid import uuid4
 
 from anthropic.types.beta import BetaToolComputerUse20241022Param
 
 from .base import BaseAnthropicTool, ToolError, ToolResult
+from .encoding import ImageEncoder
+from .frames import FrameChangeDetector, SettleDetector
+from .display import XvfbDisplay
+from .input import InputAction, InputBackend, XdotoolBackend, default_input_backend
+from .prefetch import ScreenshotPrefetcher
 from .run import run
+from .screen import CaptureBackend, Frame, MssBackend, default_backend
+from .screenshot_store import ScreenshotStore, get_store
+from .tracing import span
 
 OUTPUT_DIR = "/tmp/outputs"
 
 TYPING_DELAY_MS = 12
-TYPING_GROUP_SIZE = 50
+# longer text is pasted through the clipboard instead of typed key by key
+PASTE_THRESHOLD = 200
+# capture the next screenshot while the model is thinking
+PREFETCH_SCREENSHOTS = os.getenv("SCREENSHOT_PREFETCH", "1") == "1"
+
+SCREEN_UNCHANGED = "The screen has not changed since the last screenshot."
 
 Action = Literal[
     "key",
@@ -59,15 +71,22 @@ class ComputerToolOptions(TypedDict):
     display_number: int | None
 
 
-def chunks(s: str, chunk_size: int) -> list[str]:
-    return [s[i : i + chunk_size] for i in range(0, len(s), chunk_size)]
+@dataclass
+class TypingStats:
+    chars: int = 0
+    seconds: float = 0.0
+
+    @property
+    def chars_per_second(self) -> float:
+        return self.chars / self.seconds if self.seconds else 0.0
 
 
 class ComputerTool(BaseAnthropicTool):
     """
-    A tool that allows the agent to interact with the screen, keyboard, and mouse of the current macOS computer.
+    A tool that allows the agent to interact with the screen, keyboard, and mouse of the current macOS computer,
+    or of an Xvfb display on Linux (see `for_display`).
     The tool parameters are defined by Anthropic and are not editable.
-    Requires cliclick to be installed: brew install cliclick
+    Requires cliclick on macOS (brew install cliclick) and xdotool on Linux.
     """
 
     name: Literal["computer"] = "computer"
@@ -76,7 +95,7 @@ class ComputerTool(BaseAnthropicTool):
     height: int
     display_num: int | None
 
-    _screenshot_delay = 1.0  # macOS is generally faster than X11
+    _screenshot_delay = 1.0  # fallback when the capture backend cannot sample the screen
     _scaling_enabled = True
 
     @property
@@ -90,12 +109,85 @@ class ComputerTool(BaseAnthropicTool):
     def to_params(self) -> BetaToolComputerUse20241022Param:
         return {"name": self.name, "type": self.api_type, **self.options}
 
-    def __init__(self):
+    def __init__(
+        self,
+        display_num: int | None = None,
+        output_dir: str = OUTPUT_DIR,
+        capture_backend: CaptureBackend | None = None,
+        skip_unchanged_screenshots: bool = True,
+        encoder: ImageEncoder | None = None,
+        input_backend: InputBackend | None = None,
+        typing_delay_ms: int = TYPING_DELAY_MS,
+        paste_threshold: int | None = PASTE_THRESHOLD,
+        size: tuple[int, int] | None = None,
+        session: str | None = None,
+        store: ScreenshotStore | None = None,
+        prefetch_screenshots: bool = PREFETCH_SCREENSHOTS,
+    ):
         super().__init__()
 
-        self.width, self.height = pyautogui.size()
+        if size is None:
+            # only needed to ask the local screen; virtual displays pass their size
+            import pyautogui
+
+            size = pyautogui.size()
+        self.width, self.height = size
         assert self.width and self.height, "WIDTH, HEIGHT must be set"
-        self.display_num = None  # macOS doesn't use X11 display numbers
+        # on macOS there are no X11 display numbers, it is only advertised to the model
+        self.display_num = display_num
+        self.output_dir = Path(output_dir)
+        self.capture_backend = capture_backend or default_backend(self.output_dir)
+        # screenshots are kept per session, parallel workers use their output_dir's name
+        self.session = session or self.output_dir.name
+        self.store = store or get_store(OUTPUT_DIR)
+        self.change_detector = FrameChangeDetector() if skip_unchanged_screenshots else None
+        self.encoder = encoder or ImageEncoder()
+        self.input_backend = input_backend or default_input_backend()
+        self.typing_delay_ms = typing_delay_ms
+        self.paste_threshold = paste_threshold
+        self.typing_stats: dict[str, TypingStats] = defaultdict(TypingStats)
+        self.settle_detector = SettleDetector(self.capture_backend, self._screenshot_delay)
+        self.prefetcher = (
+            ScreenshotPrefetcher(self.capture_backend, self.encoder) if prefetch_screenshots else None
+        )
+
+    @classmethod
+    def for_display(cls, display: XvfbDisplay, **kwargs) -> "ComputerTool":
+        """A ComputerTool that drives an Xvfb display from a DisplayPool."""
+        return cls(
+            display_num=display.number,
+            capture_backend=MssBackend(display.name),
+            input_backend=XdotoolBackend(display.name),
+            size=(display.width, display.height),
+            **kwargs,
+        )
+
+    @property
+    def latest(self) -> Frame | None:
+        """The most recent screenshot, used as evidence when recording a result."""
+        return self.store.latest(self.session)
+
+    def forget_sent_images(self):
+        if self.change_detector:
+            self.change_detector.reset()
+
+    def prefetch(self):
+        if self.prefetcher:
+            self.prefetcher.start(self._screenshot_size())
+
+    def close(self):
+        # a capture started for a turn that will never come
+        if self.prefetcher:
+            self.prefetcher.cancel()
+
+    def _screenshot_size(self) -> tuple[int, int] | None:
+        if self._scaling_enabled:
+            return (SCALE_DESTINATION["width"], SCALE_DESTINATION["height"])
+        return None
+
+    def _input_sent(self):
+        if self.prefetcher:
+            self.prefetcher.invalidate()
 
     async def __call__(
         self,
@@ -117,11 +209,7 @@ class ComputerTool(BaseAnthropicTool):
                 raise ToolError(f"{coordinate} must be a tuple of non-negative ints")
 
             x, y = self.scale_coordinates(ScalingSource.API, coordinate[0], coordinate[1])
-
-            if action == "mouse_move":
-                return await self.shell(f"cliclick m:{x},{y}")
-            elif action == "left_click_drag":
-                return await self.shell(f"cliclick dd:{x},{y}")
+            return await self.input([{"action": action, "coordinate": (x, y)}])
 
         if action in ("key", "type"):
             if text is None:
@@ -132,52 +220,18 @@ class ComputerTool(BaseAnthropicTool):
                 raise ToolError(output=f"{text} must be a string")
 
             if action == "key":
-                # Convert common key names to pyautogui format
-                key_map = {
-                    "Return": "enter",
-                    "space": "space",
-                    "Tab": "tab",
-                    "Left": "left",
-                    "Right": "right",
-                    "Up": "up",
-                    "Down": "down",
-                    "Escape": "esc",
-                    "command": "command",
-                    "cmd": "command",
-                    "alt": "alt",
-                    "shift": "shift",
-                    "ctrl": "ctrl"
-                }
-
-                try:
-                    if "+" in text:
-                        # Handle combinations like "ctrl+c"
-                        keys = text.split("+")
-                        mapped_keys = [key_map.get(k.strip(), k.strip()) for k in keys]
-                        await asyncio.get_event_loop().run_in_executor(
-                            None, keyboard.press_and_release, '+'.join(mapped_keys)
-                        )
-                    else:
-                        # Handle single keys
-                        mapped_key = key_map.get(text, text)
-                        await asyncio.get_event_loop().run_in_executor(
-                            None, keyboard.press_and_release, mapped_key
-                        )
-
-                    return ToolResult(output=f"Pressed key: {text}", error=None, base64_image=None)
-
-                except Exception as e:
-                    return ToolResult(output=None, error=str(e), base64_image=None)
+                result = await self.input([{"action": "key", "text": text}])
+                return result.replace(output=f"Pressed key: {text}")
             elif action == "type":
-                results: list[ToolResult] = []
-                for chunk in chunks(text, TYPING_GROUP_SIZE):
-                    cmd = f"cliclick w:{TYPING_DELAY_MS} t:{shlex.quote(chunk)}"
-                    results.append(await self.shell(cmd, take_screenshot=False))
-                screenshot_base64 = (await self.screenshot()).base64_image
+                result = await self.type_text(text)
+                # typing never waited before its screenshot, so don't add the fallback delay
+                await self.settle_detector.wait(action, fallback_delay=0)
+                screenshot = await self.screenshot()
                 return ToolResult(
-                    output="".join(result.output or "" for result in results),
-                    error="".join(result.error or "" for result in results),
-                    base64_image=screenshot_base64,
+                    output=(result.output or "") + (screenshot.output or ""),
+                    error=result.error,
+                    base64_image=screenshot.base64_image,
+                    media_type=screenshot.media_type,
                 )
 
         if action in (
@@ -196,61 +250,123 @@ class ComputerTool(BaseAnthropicTool):
             if action == "screenshot":
                 return await self.screenshot()
             elif action == "cursor_position":
-                result = await self.shell(
-                    "cliclick p",
-                    take_screenshot=False,
-                )
-                import pdb; pdb.set_trace()
-                if result.output:
-                    x, y = map(int, result.output.strip().split(","))
-                    x, y = self.scale_coordinates(ScalingSource.COMPUTER, x, y)
-                    return result.replace(output=f"X={x},Y={y}")
-                return result
+                x, y = await self.input_backend.cursor_position()
+                x, y = self.scale_coordinates(ScalingSource.COMPUTER, x, y)
+                return ToolResult(output=f"X={x},Y={y}")
             else:
-                click_cmd = {
-                    "left_click": "c:.",
-                    "right_click": "rc:.",
-                    "middle_click": "mc:.",
-                    "double_click": "dc:.",
-                }[action]
-                return await self.shell(f"cliclick {click_cmd}")
+                return await self.input([{"action": action}])
 
         raise ToolError(f"Invalid action: {action}")
 
     async def screenshot(self):
         """Take a screenshot of the current screen and return the base64 encoded image."""
-        output_dir = Path(OUTPUT_DIR)
-        output_dir.mkdir(parents=True, exist_ok=True)
-        path = output_dir / f"screenshot_{uuid4().hex}.png"
-
-        # Use macOS native screencapture
-        screenshot_cmd = f"screencapture -x {path}"
-        result = await self.shell(screenshot_cmd, take_screenshot=False)
+        size = self._screenshot_size()
 
-        if self._scaling_enabled:
-            x, y = SCALE_DESTINATION['width'], SCALE_DESTINATION['height']
-            await self.shell(
-                f"sips -z {y} {x} {path}",  # sips is macOS native image processor
-                take_screenshot=False
+        with span("screenshot", backend=self.capture_backend.name) as screenshot_span:
+            prefetched = await self.prefetcher.take(size) if self.prefetcher else None
+            if prefetched:
+                frame, encoded = prefetched
+                screenshot_span.attributes["prefetched"] = True
+            else:
+                frame = await self.capture_backend.capture(size)
+                encoded = None
+            self.store.put(self.session, frame)
+            detector = self.change_detector
+            if detector and await asyncio.to_thread(detector.is_unchanged, frame):
+                # the totals so far are kept in detector.stats
+                screenshot_span.attributes["unchanged"] = True
+                return ToolResult(output=SCREEN_UNCHANGED)
+            if encoded is None:
+                with span("screenshot.encode") as encode_span:
+                    encoded = await asyncio.to_thread(self.encoder.encode, frame)
+                    base64_image = base64.b64encode(encoded.data).decode()
+                    encode_span.attributes.update(media_type=encoded.media_type, bytes=len(base64_image))
+            else:
+                base64_image = base64.b64encode(encoded.data).decode()
+            if detector:
+                detector.sent(len(base64_image))
+        return ToolResult(base64_image=base64_image, media_type=encoded.media_type)
+
+    async def zoom(self, region: tuple[int, int, int, int]) -> ToolResult:
+        """Capture (x0, y0, x1, y1), given in API coordinates, at the screen's native resolution."""
+        x0, y0 = self.scale_coordinates(ScalingSource.API, region[0], region[1])
+        x1, y1 = self.scale_coordinates(ScalingSource.API, region[2], region[3])
+        x1, y1 = min(x1, self.width), min(y1, self.height)
+        if x1 <= x0 or y1 <= y0:
+            raise ToolError(f"{list(region)} must have x0 < x1 and y0 < y1")
+        # a zoom must never cost more tokens than a full screenshot
+        max_pixels = SCALE_DESTINATION["width"] * SCALE_DESTINATION["height"]
+        if (x1 - x0) * (y1 - y0) > max_pixels:
+            raise ToolError(
+                f"{list(region)} is too large to show at native resolution, take a screenshot or zoom into a smaller region"
             )
 
-        if path.exists():
+        with span("screenshot.zoom", backend=self.capture_backend.name) as zoom_span:
+            # the region is in points, a Retina display captures 4x as many pixels, so the
+            # backend checks the captured frame again and scales it down to the limit
+            frame = await self.capture_backend.capture_region((x0, y0, x1, y1), max_pixels)
+            encoded = await asyncio.to_thread(self.encoder.encode, frame)
+            base64_image = base64.b64encode(encoded.data).decode()
+            zoom_span.attributes.update(
+                width=frame.width, height=frame.height, media_type=encoded.media_type, bytes=len(base64_image)
+            )
+        return ToolResult(
+            output=f"Region {list(region)} at {frame.width}x{frame.height} pixels.",
+            base64_image=base64_image,
+            media_type=encoded.media_type,
+        )
+
+    async def type_text(self, text: str) -> ToolResult:
+        """Type text in one backend call, or paste it when it is long."""
+        paste = (
+            self.paste_threshold is not None
+            and len(text) >= self.paste_threshold
+            and self.input_backend.clipboard_command is not None
+        )
+        method = "paste" if paste else "type"
+        self._input_sent()
+        started = time.perf_counter()
+        with span("computer.type", method=method, chars=len(text)) as type_span:
+            if paste:
+                result = await self.input_backend.paste(text, self.typing_delay_ms)
+            else:
+                result = await self.input_backend.type_text(text, self.typing_delay_ms)
+            seconds = time.perf_counter() - started
+            type_span.attributes["chars_per_second"] = round(len(text) / seconds)
+        stats = self.typing_stats[method]
+        stats.chars += len(text)
+        stats.seconds += seconds
+        return result
+
+    async def input(self, actions: list[InputAction], take_screenshot=False) -> ToolResult:
+        """Run primitive input actions (in native coordinates) in one backend process."""
+        self._input_sent()
+        result = await self.input_backend.run(actions)
+        if take_screenshot:
+            await self.settle_detector.wait(actions[-1]["action"])
+            screenshot = await self.screenshot()
             return result.replace(
-                base64_image=base64.b64encode(path.read_bytes()).decode()
+                output=(result.output or "") + (screenshot.output or ""),
+                base64_image=screenshot.base64_image,
+                media_type=screenshot.media_type,
             )
-        raise ToolError(f"Failed to take screenshot: {result.error}")
+        return result
 
     async def shell(self, command: str, take_screenshot=False) -> ToolResult:
         """Run a shell command and return the output, error, and optionally a screenshot."""
+        self._input_sent()
         _, stdout, stderr = await run(command)
-        base64_image = None
+        base64_image = media_type = None
 
         if take_screenshot:
-            # delay to let things settle before taking a screenshot
-            await asyncio.sleep(self._screenshot_delay)
-            base64_image = (await self.screenshot()).base64_image
-
-        return ToolResult(output=stdout, error=stderr, base64_image=base64_image)
+            await self.settle_detector.wait(command.split()[0])
+            screenshot = await self.screenshot()
+            base64_image, media_type = screenshot.base64_image, screenshot.media_type
+            stdout += screenshot.output or ""
+
+        return ToolResult(
+            output=stdout, error=stderr, base64_image=base64_image, media_type=media_type
+        )
 
     def scale_coordinates(self, source: ScalingSource, x: int, y: int) -> tuple[int, int]:
         """
@@ -0,0 +1,177 @@
+"""
+Pool of Xvfb virtual displays, so several agents can run headless on one Linux host.
+
+Each leased display is a separate X server with its own screen, mouse and keyboard,
+with an incognito browser filling it (`XVFB_BROWSER`, empty for a bare display). Other
+applications for an agent are started with `display.env` so that they open on it.
+"""
+
+import asyncio
+import contextlib
+import os
+import shlex
+import signal
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from .base import ToolError
+from .tracing import span
+
+DISPLAY_WIDTH = int(os.getenv("XVFB_WIDTH", "1366"))
+DISPLAY_HEIGHT = int(os.getenv("XVFB_HEIGHT", "768"))
+FIRST_DISPLAY_NUM = int(os.getenv("XVFB_FIRST_DISPLAY", "10"))
+MAX_DISPLAYS = int(os.getenv("XVFB_MAX_DISPLAYS", "8"))
+STARTUP_TIMEOUT = 5.0  # seconds
+# there is no window manager to maximise windows, so the browser is sized to the screen
+BROWSER_COMMAND = os.getenv(
+    "XVFB_BROWSER",
+    "chromium --incognito --no-first-run --no-default-browser-check"
+    " --window-position=0,0 --window-size={width},{height}",
+)
+
+X11_SOCKET_DIR = Path("/tmp/.X11-unix")
+
+
+@dataclass
+class XvfbDisplay:
+    number: int
+    width: int
+    height: int
+    process: asyncio.subprocess.Process | None = field(default=None, repr=False)
+    browser: asyncio.subprocess.Process | None = field(default=None, repr=False)
+
+    @property
+    def name(self) -> str:
+        return f":{self.number}"
+
+    @property
+    def env(self) -> dict[str, str]:
+        return {**os.environ, "DISPLAY": self.name}
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+
+class DisplayPool:
+    """Starts Xvfb servers on demand and leases each one to a single agent at a time."""
+
+    def __init__(
+        self,
+        width: int = DISPLAY_WIDTH,
+        height: int = DISPLAY_HEIGHT,
+        first_display_num: int = FIRST_DISPLAY_NUM,
+        max_displays: int = MAX_DISPLAYS,
+        browser_command: str = BROWSER_COMMAND,
+    ):
+        self.width = width
+        self.height = height
+        self.first_display_num = first_display_num
+        self.max_displays = max_displays
+        self.browser_command = browser_command
+        self._idle: list[XvfbDisplay] = []
+        self._leased: set[int] = set()
+        self._started: dict[int, XvfbDisplay] = {}
+        self._available = asyncio.Condition()
+
+    def _in_use(self, number: int) -> bool:
+        return (
+            number in self._started
+            or Path(f"/tmp/.X{number}-lock").exists()
+            or (X11_SOCKET_DIR / f"X{number}").exists()
+        )
+
+    async def _start(self) -> XvfbDisplay:
+        number = self.first_display_num
+        while self._in_use(number):
+            number += 1
+        display = XvfbDisplay(number, self.width, self.height)
+        self._started[number] = display
+        with span("display.start", display=display.name):
+            display.process = await asyncio.create_subprocess_exec(
+                "Xvfb",
+                display.name,
+                "-screen",
+                "0",
+                f"{self.width}x{self.height}x24",
+                "-nolisten",
+                "tcp",
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            socket = X11_SOCKET_DIR / f"X{number}"
+            for _ in range(int(STARTUP_TIMEOUT / 0.05)):
+                if socket.exists():
+                    await self._start_browser(display)
+                    return display
+                if not display.alive:
+                    break
+                await asyncio.sleep(0.05)
+        await self._stop(display)
+        raise ToolError(f"Xvfb did not start on display {display.name}")
+
+    async def _start_browser(self, display: XvfbDisplay):
+        if not self.browser_command:
+            return
+        command = self.browser_command.format(width=display.width, height=display.height)
+        try:
+            display.browser = await asyncio.create_subprocess_exec(
+                *shlex.split(command),
+                env=display.env,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+                start_new_session=True,
+            )
+        except FileNotFoundError:
+            await self._stop(display)
+            raise ToolError(
+                f"{command.split()[0]} not found, install it or set XVFB_BROWSER"
+            ) from None
+
+    async def _stop(self, display: XvfbDisplay):
+        self._started.pop(display.number, None)
+        if display.browser is not None and display.browser.returncode is None:
+            # the browser's helper processes share its session
+            with contextlib.suppress(ProcessLookupError):
+                os.killpg(display.browser.pid, signal.SIGTERM)
+            await display.browser.wait()
+        if display.alive:
+            display.process.terminate()
+            await display.process.wait()
+
+    async def lease(self) -> XvfbDisplay:
+        """A display for one agent, started if no idle one is left; waits when at the limit."""
+        async with self._available:
+            while True:
+                # displays killed from outside (e.g. the Streamlit Reset button) are replaced
+                for display in [d for d in self._idle if not d.alive]:
+                    self._idle.remove(display)
+                    await self._stop(display)
+                if self._idle:
+                    display = self._idle.pop()
+                    # e.g. closed by the previous agent
+                    if display.browser is not None and display.browser.returncode is not None:
+                        await self._start_browser(display)
+                    break
+                if len(self._started) < self.max_displays:
+                    display = await self._start()
+                    break
+                await self._available.wait()
+            self._leased.add(display.number)
+            return display
+
+    async def release(self, display: XvfbDisplay):
+        async with self._available:
+            self._leased.discard(display.number)
+            if display.alive:
+                self._idle.append(display)
+            else:
+                await self._stop(display)
+            self._available.notify()
+
+    async def close(self):
+        """Stop every display the pool started."""
+        for display in list(self._started.values()):
+            await self._stop(display)
+        self._idle.clear()
+        self._leased.clear()
@@ -1,10 +1,10 @@
-from collections import defaultdict
 from pathlib import Path
 from typing import Literal, get_args
 
 from anthropic.types.beta import BetaToolTextEditor20241022Param
 
 from .base import BaseAnthropicTool, CLIResult, ToolError, ToolResult
+from .edit_history import EditHistory
 from .run import maybe_truncate, run
 
 Command = Literal[
@@ -26,10 +26,10 @@ class EditTool(BaseAnthropicTool):
     api_type: Literal["text_editor_20241022"] = "text_editor_20241022"
     name: Literal["str_replace_editor"] = "str_replace_editor"
 
-    _file_history: dict[Path, list[str]]
+    _file_history: EditHistory
 
-    def __init__(self):
-        self._file_history = defaultdict(list)
+    def __init__(self, history: EditHistory | None = None):
+        self._file_history = history or EditHistory()
         super().__init__()
 
     def to_params(self) -> BetaToolTextEditor20241022Param:
@@ -58,7 +58,7 @@ class EditTool(BaseAnthropicTool):
             if not file_text:
                 raise ToolError("Parameter `file_text` is required for command: create")
             self.write_file(_path, file_text)
-            self._file_history[_path].append(file_text)
+            self._file_history.push(_path, file_text)
             return ToolResult(output=f"File created successfully at: {_path}")
         elif command == "str_replace":
             if not old_str:
@@ -184,7 +184,7 @@ class EditTool(BaseAnthropicTool):
         self.write_file(path, new_file_content)
 
         # Save the content to history
-        self._file_history[path].append(file_content)
+        self._file_history.push(path, file_content)
 
         # Create a snippet of the edited section
         replacement_line = file_content.split(old_str)[0].count("\n")
@@ -229,7 +229,7 @@ class EditTool(BaseAnthropicTool):
         snippet = "\n".join(snippet_lines)
 
         self.write_file(path, new_file_text)
-        self._file_history[path].append(file_text)
+        self._file_history.push(path, file_text)
 
         success_msg = f"The file {path} has been edited. "
         success_msg += self._make_output(
@@ -242,10 +242,10 @@ class EditTool(BaseAnthropicTool):
 
     def undo_edit(self, path: Path):
         """Implement the undo_edit command."""
-        if not self._file_history[path]:
+        old_text = self._file_history.pop(path)
+        if old_text is None:
             raise ToolError(f"No edit history found for {path}.")
 
-        old_text = self._file_history[path].pop()
         self.write_file(path, old_text)
 
         return CLIResult(
@@ -0,0 +1,161 @@
+"""
+Undo history for EditTool.
+
+Each file keeps the text its next undo restores in full, and every older restore point
+as a reverse diff against the one after it: the changed middle region, with the common
+prefix and suffix left out, zlib-compressed when that is smaller. Edits touch one region
+of a file, so a history costs about one copy of the file plus the edited regions.
+
+Histories are bounded per file and in total. Past a cap the oldest restore points are
+dropped, from the least recently edited file first for the global cap.
+"""
+
+import os
+import sys
+import zlib
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from pathlib import Path
+
+MAX_FILE_BYTES = int(os.getenv("EDIT_HISTORY_FILE_MB", "16")) * 2**20
+MAX_BYTES = int(os.getenv("EDIT_HISTORY_MB", "64")) * 2**20
+# smaller regions are not worth a zlib stream
+COMPRESS_MIN_CHARS = 256
+DIFF_OVERHEAD = 64  # bytes per stored diff besides its payload, roughly
+_BLOCK = 4096
+
+
+def _common_prefix(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    # compare block by block in C, then find the first difference inside the block
+    while i < n:
+        j = min(i + _BLOCK, n)
+        if a[i:j] != b[i:j]:
+            while a[i] == b[i]:
+                i += 1
+            return i
+        i = j
+    return n
+
+
+def _common_suffix(a: str, b: str, limit: int) -> int:
+    i = 0
+    while i < limit:
+        j = min(i + _BLOCK, limit)
+        if a[len(a) - j : len(a) - i] != b[len(b) - j : len(b) - i]:
+            while a[len(a) - 1 - i] == b[len(b) - 1 - i]:
+                i += 1
+            return i
+        i = j
+    return limit
+
+
+@dataclass
+class _Diff:
+    """older = newer[:start] + middle + newer[end:]"""
+
+    start: int
+    end: int
+    middle: str | bytes  # bytes when compressed
+
+    @property
+    def size(self) -> int:
+        return sys.getsizeof(self.middle) + DIFF_OVERHEAD
+
+    def apply(self, newer: str) -> str:
+        middle = self.middle
+        if isinstance(middle, bytes):
+            middle = zlib.decompress(middle).decode()
+        return newer[: self.start] + middle + newer[self.end :]
+
+
+@dataclass
+class _FileHistory:
+    latest: str
+    # oldest first
+    diffs: deque[_Diff] = field(default_factory=deque)
+    size: int = 0
+
+    def __post_init__(self):
+        self.size = sys.getsizeof(self.latest)
+
+
+class EditHistory:
+    """Stacks of texts to restore, one per file, within fixed memory caps."""
+
+    def __init__(
+        self,
+        max_file_bytes: int = MAX_FILE_BYTES,
+        max_bytes: int = MAX_BYTES,
+        compress: bool = True,
+    ):
+        self.max_file_bytes = max_file_bytes
+        self.max_bytes = max_bytes
+        self.compress = compress
+        # least recently edited first
+        self._files: OrderedDict[Path, _FileHistory] = OrderedDict()
+        self.size = 0
+
+    def __contains__(self, path: Path) -> bool:
+        return path in self._files
+
+    def _diff(self, older: str, newer: str) -> _Diff:
+        prefix = _common_prefix(older, newer)
+        suffix = _common_suffix(older, newer, min(len(older), len(newer)) - prefix)
+        middle: str | bytes = older[prefix : len(older) - suffix]
+        if self.compress and len(middle) >= COMPRESS_MIN_CHARS:
+            compressed = zlib.compress(middle.encode())
+            if len(compressed) < len(middle):
+                middle = compressed
+        return _Diff(prefix, len(newer) - suffix, middle)
+
+    def push(self, path: Path, text: str):
+        """Record `text` as what the next undo of `path` restores."""
+        history = self._files.get(path)
+        if history is None:
+            history = self._files[path] = _FileHistory(text)
+            self.size += history.size
+        else:
+            diff = self._diff(history.latest, text)
+            history.diffs.append(diff)
+            self._resize(history, sys.getsizeof(text) - sys.getsizeof(history.latest) + diff.size)
+            history.latest = text
+        self._files.move_to_end(path)
+        self._evict(path)
+
+    def pop(self, path: Path) -> str | None:
+        """The text the last edit of `path` replaced, or None without history."""
+        history = self._files.get(path)
+        if history is None:
+            return None
+        text = history.latest
+        if history.diffs:
+            diff = history.diffs.pop()
+            history.latest = diff.apply(text)
+            self._resize(history, sys.getsizeof(history.latest) - sys.getsizeof(text) - diff.size)
+            self._files.move_to_end(path)
+        else:
+            self._remove(path)
+        return text
+
+    def _resize(self, history: _FileHistory, delta: int):
+        history.size += delta
+        self.size += delta
+
+    def _remove(self, path: Path):
+        self.size -= self._files.pop(path).size
+
+    def _drop_oldest(self, path: Path):
+        history = self._files[path]
+        if history.diffs:
+            self._resize(history, -history.diffs.popleft().size)
+        else:
+            # only the latest restore point is left, and it alone is over a cap
+            self._remove(path)
+
+    def _evict(self, path: Path):
+        while path in self._files and self._files[path].size > self.max_file_bytes:
+            self._drop_oldest(path)
+        while self.size > self.max_bytes:
+            self._drop_oldest(next(iter(self._files)))
@@ -0,0 +1,93 @@
+"""
+Encodes screenshots for the model.
+
+With format "auto", text-heavy frames (mostly flat UI) stay lossless, as WebP when
+Pillow supports it since that is about half the size of PNG, and photographic
+frames are sent as JPEG. A byte budget re-encodes oversized images as JPEG at
+falling quality until they fit.
+"""
+
+import io
+import os
+from dataclasses import dataclass
+from typing import Literal
+
+from .screen import Frame
+
+try:
+    from PIL import Image, ImageChops, features
+except ImportError:
+    Image = None
+
+ImageFormat = Literal["auto", "png", "webp", "jpeg"]
+
+DEFAULT_FORMAT: ImageFormat = os.getenv("SCREENSHOT_FORMAT", "auto")  # type: ignore[assignment]
+DEFAULT_QUALITY = int(os.getenv("SCREENSHOT_QUALITY", "80"))
+DEFAULT_MAX_BYTES = int(os.getenv("SCREENSHOT_MAX_BYTES", "0")) or None
+MIN_QUALITY = 30
+# frames where at least this fraction of pixels equals its left neighbour are text/UI
+TEXT_HEAVY_FLAT_FRACTION = 0.4
+
+
+@dataclass
+class EncodedImage:
+    data: bytes
+    media_type: str
+
+
+def flat_fraction(image: "Image.Image") -> float:
+    """Fraction of (half-resolution, greyscale) pixels identical to their left neighbour."""
+    grey = image.convert("L").reduce(2)
+    shifted = grey.transform(grey.size, Image.Transform.AFFINE, (1, 0, 1, 0, 1, 0))
+    return ImageChops.difference(grey, shifted).histogram()[0] / (grey.width * grey.height)
+
+
+class ImageEncoder:
+    """Chooses the format and quality of each screenshot sent to the model."""
+
+    def __init__(
+        self,
+        format: ImageFormat = DEFAULT_FORMAT,
+        quality: int = DEFAULT_QUALITY,
+        max_bytes: int | None = DEFAULT_MAX_BYTES,
+    ):
+        self.format = format
+        self.quality = quality
+        self.max_bytes = max_bytes
+
+    def _save(self, image: "Image.Image", format: str, **params) -> bytes:
+        buffer = io.BytesIO()
+        image.save(buffer, format=format, **params)
+        return buffer.getvalue()
+
+    def _jpeg(self, image: "Image.Image", quality: int) -> EncodedImage:
+        return EncodedImage(self._save(image, "JPEG", quality=quality), "image/jpeg")
+
+    def _lossless(self, frame: Frame, image: "Image.Image") -> EncodedImage:
+        if self.format != "png" and features.check("webp"):
+            return EncodedImage(self._save(image, "WEBP", lossless=True, method=0), "image/webp")
+        return EncodedImage(frame.png(), "image/png")
+
+    def encode(self, frame: Frame) -> EncodedImage:
+        if Image is None or (self.format == "png" and not self.max_bytes):
+            return EncodedImage(frame.png(), "image/png")
+        image = frame.image
+        if image is None:
+            image = Image.open(io.BytesIO(frame.png())).convert("RGB")
+
+        if self.format == "jpeg":
+            encoded = self._jpeg(image, self.quality)
+        elif self.format == "png" or flat_fraction(image) >= TEXT_HEAVY_FLAT_FRACTION:
+            encoded = self._lossless(frame, image)
+        elif self.format == "webp":
+            encoded = EncodedImage(
+                self._save(image, "WEBP", quality=self.quality, method=0), "image/webp"
+            )
+        else:
+            encoded = self._jpeg(image, self.quality)
+
+        quality = self.quality
+        while self.max_bytes and len(encoded.data) > self.max_bytes and quality > MIN_QUALITY:
+            quality = max(quality - 10, MIN_QUALITY)
+            encoded = self._jpeg(image, quality)
+        return encoded
@@ -0,0 +1,160 @@
+"""
+Frame comparison for ComputerTool.
+
+`FrameChangeDetector` recognises screenshots that are indistinguishable from the last
+one sent to the model, comparing half-resolution greyscale thumbnails: a frame counts
+as unchanged when the fraction of thumbnail pixels that moved by more than
+`PIXEL_TOLERANCE` grey levels is at most the threshold. Needs Pillow; without it
+every frame counts as changed.
+
+`SettleDetector` waits after an action until low-resolution samples of the screen
+stop changing, instead of sleeping for a fixed delay.
+"""
+
+import asyncio
+import io
+import os
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from .screen import CaptureBackend, Frame
+from .tracing import span
+
+try:
+    from PIL import Image, ImageChops
+except ImportError:
+    Image = None
+
+# fraction of thumbnail pixels allowed to change; 0 skips only visually identical frames
+DEFAULT_THRESHOLD = float(os.getenv("SCREEN_CHANGE_THRESHOLD", "0"))
+# grey levels of difference absorbed as resampling and anti-aliasing noise
+PIXEL_TOLERANCE = 8
+THUMBNAIL_REDUCTION = 2
+
+SETTLE_INTERVAL = 0.1  # seconds between samples
+SETTLE_STABLE_SAMPLES = 3  # consecutive identical samples that count as settled
+SETTLE_TIMEOUT = float(os.getenv("SCREEN_SETTLE_TIMEOUT", "3.0"))
+
+
+def changed_fraction(a: "Image.Image", b: "Image.Image", tolerance: int = PIXEL_TOLERANCE) -> float:
+    """Fraction of pixels that differ by more than `tolerance` grey levels."""
+    if a.size != b.size:
+        return 1.0
+    mask = ImageChops.difference(a, b).point(lambda v: 255 if v > tolerance else 0)
+    return mask.histogram()[255] / (a.width * a.height)
+
+
+@dataclass
+class ChangeStats:
+    sent: int = 0
+    skipped: int = 0
+    bytes_saved: int = 0  # base64 bytes, estimated from the frame last sent
+
+
+class FrameChangeDetector:
+    """Remembers the last frame sent to the model and recognises repeats of it."""
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, tolerance: int = PIXEL_TOLERANCE):
+        self.threshold = threshold
+        self.tolerance = tolerance
+        self.stats = ChangeStats()
+        self._last: "Image.Image | None" = None
+        self._last_bytes = 0
+        self._candidate: "Image.Image | None" = None
+
+    def _thumbnail(self, frame: Frame) -> "Image.Image | None":
+        if Image is None:
+            return None
+        image = frame.image
+        if image is None and frame.data is not None:
+            image = Image.open(io.BytesIO(frame.data))
+        if image is None:
+            return None
+        return image.convert("L").reduce(THUMBNAIL_REDUCTION)
+
+    def is_unchanged(self, frame: Frame) -> bool:
+        """Whether `frame` repeats the last sent one; if not, call `sent` once it is sent."""
+        thumbnail = self._thumbnail(frame)
+        if (
+            thumbnail is not None
+            and self._last is not None
+            and changed_fraction(thumbnail, self._last, self.tolerance) <= self.threshold
+        ):
+            self.stats.skipped += 1
+            self.stats.bytes_saved += self._last_bytes
+            return True
+        self._candidate = thumbnail
+        return False
+
+    def sent(self, size: int):
+        """Record that the frame last checked was sent to the model as `size` bytes."""
+        self._last, self._candidate = self._candidate, None
+        self._last_bytes = size
+        self.stats.sent += 1
+
+    def reset(self):
+        """Forget the last sent frame, e.g. once it is no longer in the conversation."""
+        self._last = self._candidate = None
+
+
+@dataclass
+class SettleStats:
+    seconds: dict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+    timeouts: int = 0
+
+    def summary(self) -> dict[str, float]:
+        """Mean settle time in milliseconds per action."""
+        return {action: sum(times) / len(times) * 1000 for action, times in self.seconds.items()}
+
+
+class SettleDetector:
+    """
+    Samples the screen every `interval` seconds after an action and returns once
+    `stable_samples` consecutive samples match, or after `timeout`. Backends that
+    cannot sample fall back to sleeping for `fallback_delay`.
+    """
+
+    def __init__(
+        self,
+        backend: CaptureBackend,
+        fallback_delay: float,
+        interval: float = SETTLE_INTERVAL,
+        stable_samples: int = SETTLE_STABLE_SAMPLES,
+        timeout: float = SETTLE_TIMEOUT,
+        tolerance: int = PIXEL_TOLERANCE,
+    ):
+        self.backend = backend
+        self.fallback_delay = fallback_delay
+        self.interval = interval
+        self.stable_samples = stable_samples
+        self.timeout = timeout
+        self.tolerance = tolerance
+        self.stats = SettleStats()
+
+    async def wait(self, action: str, fallback_delay: float | None = None) -> float:
+        """Wait for the screen to settle after `action`; returns the seconds waited."""
+        with span("screenshot.settle", action=action) as settle_span:
+            started = time.perf_counter()
+            previous = await self.backend.sample() if Image is not None else None
+            if previous is None:
+                await asyncio.sleep(self.fallback_delay if fallback_delay is None else fallback_delay)
+                return time.perf_counter() - started
+
+            samples = stable = 1
+            timed_out = False
+            while stable < self.stable_samples:
+                if time.perf_counter() - started >= self.timeout:
+                    timed_out = True
+                    break
+                await asyncio.sleep(self.interval)
+                current = await self.backend.sample()
+                samples += 1
+                stable = stable + 1 if changed_fraction(current, previous, self.tolerance) == 0 else 1
+                previous = current
+
+            seconds = time.perf_counter() - started
+            settle_span.attributes.update(samples=samples, timed_out=timed_out)
+        self.stats.seconds[action].append(seconds)
+        self.stats.timeouts += timed_out
+        return seconds
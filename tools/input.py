@@ -0,0 +1,301 @@
+"""
+Input backends for ComputerTool.
+
+A backend turns a list of primitive actions into one command line, so a whole batch
+of moves, clicks, keys and typing runs in a single process. Coordinates are native
+screen pixels; scaling from API coordinates happens in ComputerTool.
+"""
+
+import asyncio
+import os
+import shlex
+import sys
+from typing import Literal, TypedDict
+
+from .base import ToolError, ToolResult
+from .run import run
+
+InputActionName = Literal[
+    "mouse_move",
+    "left_click",
+    "right_click",
+    "middle_click",
+    "double_click",
+    "left_click_drag",
+    "type",
+    "key",
+    "wait",
+]
+
+CLIPBOARD_TIMEOUT = 2.0  # seconds
+
+
+class InputAction(TypedDict, total=False):
+    action: InputActionName
+    coordinate: tuple[int, int]
+    text: str
+    duration_ms: int
+
+
+class InputBackend:
+    """Runs batches of primitive input actions."""
+
+    name: str
+    program: list[str]
+    # reads the text to put on the clipboard from stdin
+    clipboard_command: list[str] | None = None
+    paste_key: str = "ctrl+v"
+
+    def commands(self, action: InputAction) -> list[str]:
+        raise NotImplementedError
+
+    async def type_text(self, text: str, delay_ms: int) -> ToolResult:
+        """Type the whole text in one process, pausing `delay_ms` between keys if supported."""
+        return await self.run([{"action": "type", "text": text}])
+
+    def env(self) -> dict[str, str] | None:
+        """Environment for the backend's processes, None to inherit ours."""
+        return None
+
+    async def paste(self, text: str, delay_ms: int = 0) -> ToolResult:
+        """
+        Put the text on the clipboard and paste it with one key combination. Falls back
+        to typing it when the clipboard command fails or does not return in time.
+        """
+        if not self.clipboard_command:
+            raise ToolError(f"{self.name} has no clipboard support")
+        # xclip stays in the background to serve the selection, so none of its output
+        # is read: an open pipe would only reach EOF once it exits
+        process = await asyncio.create_subprocess_exec(
+            *self.clipboard_command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+            env=self.env(),
+        )
+        try:
+            await asyncio.wait_for(process.communicate(text.encode()), CLIPBOARD_TIMEOUT)
+        except asyncio.TimeoutError:
+            process.kill()
+            return await self.type_text(text, delay_ms)
+        if process.returncode:
+            return await self.type_text(text, delay_ms)
+        return await self.run([{"action": "key", "text": self.paste_key}])
+
+    async def run(self, actions: list[InputAction]) -> ToolResult:
+        """Run all actions in order in one process."""
+        args = [arg for action in actions for arg in self.commands(action)]
+        _, stdout, stderr = await run(shlex.join([*self.program, *args]))
+        return ToolResult(output=stdout, error=stderr)
+
+    async def cursor_position(self) -> tuple[int, int]:
+        raise NotImplementedError
+
+
+CLICLICK_MODIFIERS = {
+    "ctrl": "ctrl",
+    "control": "ctrl",
+    "alt": "alt",
+    "option": "alt",
+    "shift": "shift",
+    "cmd": "cmd",
+    "command": "cmd",
+    "super": "cmd",
+    "meta": "cmd",
+    "fn": "fn",
+}
+CLICLICK_KEYS = {
+    "return": "return",
+    "enter": "enter",
+    "tab": "tab",
+    "escape": "esc",
+    "esc": "esc",
+    "space": "space",
+    "backspace": "delete",
+    "delete": "fwd-delete",
+    "up": "arrow-up",
+    "down": "arrow-down",
+    "left": "arrow-left",
+    "right": "arrow-right",
+    "home": "home",
+    "end": "end",
+    "page_up": "page-up",
+    "pageup": "page-up",
+    "page_down": "page-down",
+    "pagedown": "page-down",
+    **{f"f{i}": f"f{i}" for i in range(1, 17)},
+}
+CLICLICK_CLICKS = {
+    "left_click": "c",
+    "right_click": "rc",
+    "middle_click": "mc",
+    "double_click": "dc",
+}
+
+
+class CliclickBackend(InputBackend):
+    """macOS input through cliclick (brew install cliclick)."""
+
+    name = "cliclick"
+    program = ["cliclick"]
+    clipboard_command = ["pbcopy"]
+    paste_key = "cmd+v"
+
+    @staticmethod
+    def key_commands(combo: str) -> list[str]:
+        """Translate an xdotool-style key combination such as "ctrl+shift+Tab"."""
+        *modifiers, key = [part.strip() for part in combo.split("+")]
+        try:
+            modifiers = [CLICLICK_MODIFIERS[modifier.lower()] for modifier in modifiers]
+        except KeyError as e:
+            raise ToolError(f"Unsupported modifier {e.args[0]} in {combo}") from None
+        if key.lower() in CLICLICK_KEYS:
+            press = f"kp:{CLICLICK_KEYS[key.lower()]}"
+        elif key.lower() in CLICLICK_MODIFIERS and not modifiers:
+            modifier = CLICLICK_MODIFIERS[key.lower()]
+            return [f"kd:{modifier}", f"ku:{modifier}"]
+        elif len(key) == 1:
+            press = f"t:{key}"
+        else:
+            raise ToolError(f"Unsupported key {key} in {combo}")
+        return [
+            *(f"kd:{modifier}" for modifier in modifiers),
+            press,
+            *(f"ku:{modifier}" for modifier in reversed(modifiers)),
+        ]
+
+    def commands(self, action: InputAction) -> list[str]:
+        name = action["action"]
+        coordinate = action.get("coordinate")
+        target = f"{coordinate[0]},{coordinate[1]}" if coordinate else "."
+        if name == "mouse_move":
+            return [f"m:{target}"]
+        if name in CLICLICK_CLICKS:
+            return [f"{CLICLICK_CLICKS[name]}:{target}"]
+        if name == "left_click_drag":
+            return ["dd:.", f"dm:{target}", f"du:{target}"]
+        if name == "type":
+            return [f"t:{action['text']}"]
+        if name == "key":
+            return self.key_commands(action["text"])
+        if name == "wait":
+            return [f"w:{action['duration_ms']}"]
+        raise ToolError(f"Invalid action: {name}")
+
+    async def type_text(self, text: str, delay_ms: int) -> ToolResult:
+        if delay_ms <= 0:
+            return await self.run([{"action": "type", "text": text}])
+        # -w pauses after every command, so one t: per character spaces out the keys
+        args = ["-w", str(delay_ms), *(f"t:{char}" for char in text)]
+        _, stdout, stderr = await run(shlex.join([*self.program, *args]))
+        return ToolResult(output=stdout, error=stderr)
+
+    async def cursor_position(self) -> tuple[int, int]:
+        _, stdout, stderr = await run("cliclick p")
+        if not stdout:
+            raise ToolError(f"Failed to read the cursor position: {stderr}")
+        x, y = map(int, stdout.strip().split(","))
+        return x, y
+
+
+
+XDOTOOL_BUTTONS = {
+    "left_click": ["click", "1"],
+    "right_click": ["click", "3"],
+    "middle_click": ["click", "2"],
+    "double_click": ["click", "--repeat", "2", "--delay", "10", "1"],
+}
+
+# the model is told about a Mac, so map its shortcuts onto their Linux equivalents
+XDOTOOL_KEY_ALIASES = {
+    "cmd": "ctrl",
+    "command": "ctrl",
+    "option": "alt",
+    "enter": "Return",
+    "esc": "Escape",
+}
+
+
+class XdotoolBackend(InputBackend):
+    """X11 input through xdotool, e.g. on an Xvfb display from tools.display."""
+
+    name = "xdotool"
+    program = ["xdotool"]
+    clipboard_command = ["xclip", "-selection", "clipboard"]
+    paste_key = "ctrl+v"
+
+    def __init__(self, display: str | None = None):
+        self.display = display or os.getenv("DISPLAY")
+
+    def env(self) -> dict[str, str] | None:
+        return {**os.environ, "DISPLAY": self.display} if self.display else None
+
+    def commands(self, action: InputAction) -> list[str]:
+        name = action["action"]
+        coordinate = action.get("coordinate")
+        move = ["mousemove", "--sync", str(coordinate[0]), str(coordinate[1])] if coordinate else []
+        if name == "mouse_move":
+            return move
+        if name in XDOTOOL_BUTTONS:
+            return [*move, *XDOTOOL_BUTTONS[name]]
+        if name == "left_click_drag":
+            return ["mousedown", "1", *move, "mouseup", "1"]
+        if name == "type":
+            return ["type", "--", action["text"]]
+        if name == "key":
+            combo = "+".join(
+                XDOTOOL_KEY_ALIASES.get(part.strip().lower(), part.strip())
+                for part in action["text"].split("+")
+            )
+            return ["key", "--", combo]
+        if name == "wait":
+            return ["sleep", str(action["duration_ms"] / 1000)]
+        raise ToolError(f"Invalid action: {name}")
+
+    def _command_line(self, actions: list[InputAction]) -> str:
+        # type and key take the rest of the arguments, so they end an xdotool chain;
+        # everything else is chained into as few xdotool invocations as possible
+        invocations: list[list[str]] = [[]]
+        for action in actions:
+            args = self.commands(action)
+            if action["action"] in ("type", "key"):
+                invocations += [args, []]
+            else:
+                invocations[-1] += args
+        return " && ".join(self._shell(args) for args in invocations if args)
+
+    def _shell(self, args: list[str]) -> str:
+        prefix = f"DISPLAY={shlex.quote(self.display)} " if self.display else ""
+        return prefix + shlex.join([*self.program, *args])
+
+    async def run(self, actions: list[InputAction]) -> ToolResult:
+        _, stdout, stderr = await run(self._command_line(actions))
+        return ToolResult(output=stdout, error=stderr)
+
+    async def type_text(self, text: str, delay_ms: int) -> ToolResult:
+        _, stdout, stderr = await run(self._shell(["type", "--delay", str(delay_ms), "--", text]))
+        return ToolResult(output=stdout, error=stderr)
+
+    async def cursor_position(self) -> tuple[int, int]:
+        process = await asyncio.create_subprocess_exec(
+            "xdotool",
+            "getmouselocation",
+            "--shell",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=self.env(),
+        )
+        stdout, stderr = await process.communicate()
+        fields = dict(
+            line.split("=", 1) for line in stdout.decode().splitlines() if "=" in line
+        )
+        if "X" not in fields:
+            raise ToolError(f"Failed to read the cursor position: {stderr.decode()}")
+        return int(fields["X"]), int(fields["Y"])
+
+
+def default_input_backend(display: str | None = None) -> InputBackend:
+    """xdotool on Linux, cliclick elsewhere (macOS)."""
+    if sys.platform.startswith("linux"):
+        return XdotoolBackend(display)
+    return CliclickBackend()
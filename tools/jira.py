@@ -5,6 +5,7 @@ dotenv.load_dotenv("../.env")
 from typing import Dict, List, Optional
 from datetime import datetime
 from tools.spreadsheet import get_test_case_data, update_cell, get_url
+from tools.tracing import traced
 
 from atlassian import Jira
 import os
@@ -18,6 +19,7 @@ jira = Jira(
     password=os.getenv('JIRA_TOKEN'),
     cloud=True)
 
+@traced("jira.attach_base64_image")
 def attach_base64_image(issue_key: str, base64_image: str, filename: str = "screenshot.png") -> bool:
     """
     Attach a base64 encoded image to a Jira issue.
@@ -54,6 +56,7 @@ def attach_base64_image(issue_key: str, base64_image: str, filename: str = "scre
         return False
 
 
+@traced("jira.create_issue")
 def create_issue(summary: str, description: str, base64_image: Optional[str] = None) -> Dict:
     """
     Create a Jira issue with optional screenshot attachment.
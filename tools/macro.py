@@ -0,0 +1,106 @@
+from typing import Any, Literal, get_args
+
+from .base import BaseAnthropicTool, ToolError, ToolResult
+from .computer import ComputerTool, ScalingSource
+from .input import InputAction, InputActionName
+from .tracing import span
+
+MAX_MACRO_ACTIONS = 50
+MAX_WAIT_MS = 5000
+
+
+class ComputerMacroTool(BaseAnthropicTool):
+    """
+    A tool that runs a list of mouse and keyboard actions in one input backend process
+    and returns a single screenshot once the screen has settled.
+    """
+
+    api_type: Literal["custom"] = "custom"
+    name: Literal["computer_macro"] = "computer_macro"
+    description: str = (
+        "Run a sequence of mouse and keyboard actions in one step, e.g. to fill in a form, "
+        "and get a single screenshot once they are done. Coordinates are in the same space "
+        "as the computer tool's. Use the computer tool when you need to see the result of "
+        "an action before choosing the next one."
+    )
+    input_schema: dict = {
+        "type": "object",
+        "properties": {
+            "actions": {
+                "type": "array",
+                "minItems": 1,
+                "maxItems": MAX_MACRO_ACTIONS,
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "action": {"type": "string", "enum": list(get_args(InputActionName))},
+                        "coordinate": {
+                            "type": "array",
+                            "items": {"type": "integer"},
+                            "description": "(x, y) for mouse_move and left_click_drag; optional for clicks, which otherwise click at the cursor.",
+                        },
+                        "text": {"type": "string", "description": "Text to type, or a key combination such as ctrl+a for key."},
+                        "duration_ms": {"type": "integer", "description": f"Pause length for wait, at most {MAX_WAIT_MS}."},
+                    },
+                    "required": ["action"],
+                },
+            }
+        },
+        "required": ["actions"],
+    }
+
+    def __init__(self, computer: ComputerTool):
+        super().__init__()
+        self.computer = computer
+
+    def _input_action(self, step: dict[str, Any]) -> InputAction:
+        name = step.get("action")
+        if name not in get_args(InputActionName):
+            raise ToolError(f"Invalid action: {name}")
+        coordinate = step.get("coordinate")
+        text = step.get("text")
+        if name in ("mouse_move", "left_click_drag") and coordinate is None:
+            raise ToolError(f"coordinate is required for {name}")
+        if name in ("type", "key"):
+            if not isinstance(text, str) or not text:
+                raise ToolError(f"text is required for {name}")
+        elif text is not None:
+            raise ToolError(f"text is not accepted for {name}")
+
+        action: InputAction = {"action": name}
+        if coordinate is not None:
+            if name in ("type", "key", "wait"):
+                raise ToolError(f"coordinate is not accepted for {name}")
+            if not isinstance(coordinate, list) or len(coordinate) != 2:
+                raise ToolError(f"{coordinate} must be a tuple of length 2")
+            if not all(isinstance(i, int) and i >= 0 for i in coordinate):
+                raise ToolError(f"{coordinate} must be a tuple of non-negative ints")
+            action["coordinate"] = self.computer.scale_coordinates(
+                ScalingSource.API, coordinate[0], coordinate[1]
+            )
+        if text is not None:
+            action["text"] = text
+        if name == "wait":
+            duration_ms = step.get("duration_ms")
+            if not isinstance(duration_ms, int) or not 0 <= duration_ms <= MAX_WAIT_MS:
+                raise ToolError(f"duration_ms must be an int between 0 and {MAX_WAIT_MS} for wait")
+            action["duration_ms"] = duration_ms
+        return action
+
+    async def __call__(self, actions: list[dict[str, Any]] | None = None, **kwargs) -> ToolResult:
+        if not actions:
+            raise ToolError("actions must be a non-empty list")
+        if len(actions) > MAX_MACRO_ACTIONS:
+            raise ToolError(f"at most {MAX_MACRO_ACTIONS} actions are accepted")
+        batch = [self._input_action(step) for step in actions]
+        with span("computer.macro", actions=[step["action"] for step in batch]):
+            result = await self.computer.input(batch, take_screenshot=True)
+        return result.replace(output=f"Ran {len(batch)} actions. {result.output or ''}".strip())
+
+    def to_params(self) -> dict:
+        return {
+            "type": self.api_type,
+            "name": self.name,
+            "description": self.description,
+            "input_schema": self.input_schema,
+        }
@@ -4,7 +4,6 @@ dotenv.load_dotenv("../.env")
 
 import os
 from typing import Dict, List, Tuple
-import anthropic
 import json
 from datetime import datetime
 from firecrawl import FirecrawlApp
@@ -14,6 +13,7 @@ from tools.spreadsheet import (
     populate_test_plan, get_url
 )
 
+from tools.clients import get_client
 from tools.mock_data import MOCK_TEST_PLANS
 
 from tools.test_case_manager import update_status, update_statuses
@@ -30,7 +30,7 @@ class TestPlanSpreadsheetGenerator:
             firecrawl_api_key (str): Firecrawl API key
         """
         try:
-            self.client = anthropic.Anthropic(api_key=anthropic_api_key)
+            self.client = get_client("anthropic", api_key=anthropic_api_key)
             self.firecrawl = FirecrawlApp(api_key=firecrawl_api_key)
         except Exception as e:
             raise Exception(f"Error initializing TestPlanSpreadsheetGenerator: {str(e)}")
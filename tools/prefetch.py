@@ -0,0 +1,116 @@
+"""
+Speculative screenshots for ComputerTool.
+
+While the model is thinking, `ScreenshotPrefetcher` captures and encodes a frame in the
+background. If the next action is a screenshot, the frame is served instead of a fresh
+capture, provided no input was sent since and a low-resolution sample of the screen
+still matches the one taken just before the prefetched capture. Backends that cannot
+sample the screen are never prefetched.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+
+from .encoding import EncodedImage, ImageEncoder
+from .frames import changed_fraction
+from .screen import CaptureBackend, Frame
+
+
+@dataclass
+class Prefetched:
+    generation: int
+    size: tuple[int, int] | None
+    sample: "object"  # PIL image, taken just before the capture
+    frame: Frame
+    encoded: EncodedImage
+    seconds: float  # spent capturing and encoding
+
+
+@dataclass
+class PrefetchStats:
+    hits: int = 0
+    misses: int = 0
+    saved_seconds: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class ScreenshotPrefetcher:
+    """Holds at most one speculative frame, discarded once input is sent to the screen."""
+
+    def __init__(self, backend: CaptureBackend, encoder: ImageEncoder):
+        self.backend = backend
+        self.encoder = encoder
+        self.stats = PrefetchStats()
+        # bumped on every input, a frame captured in an older generation is stale
+        self.generation = 0
+        self._task: asyncio.Task[Prefetched | None] | None = None
+        # generation and size the current task captures for, known before it finishes
+        self._task_key: tuple[int, tuple[int, int] | None] | None = None
+
+    def invalidate(self):
+        self.generation += 1
+        # whatever the task captures may predate the input, so it can never be served
+        self._discard()
+
+    def cancel(self):
+        """Stop waiting for the capture in flight, e.g. once the tool is closed."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = self._task_key = None
+
+    def _discard(self):
+        if self._task is not None:
+            self.cancel()
+            self.stats.misses += 1
+
+    def start(self, size: tuple[int, int] | None):
+        if self._task is not None:
+            if self._task_key == (self.generation, size):
+                return
+            self._discard()
+        self._task = asyncio.create_task(self._prefetch(size, self.generation))
+        self._task_key = (self.generation, size)
+
+    async def _prefetch(self, size: tuple[int, int] | None, generation: int) -> Prefetched | None:
+        try:
+            sample = await self.backend.sample()
+            if sample is None:
+                return None
+            started = time.perf_counter()
+            frame = await self.backend.capture(size)
+            encoded = await asyncio.to_thread(self.encoder.encode, frame)
+        except Exception as e:
+            print(f"Screenshot prefetch failed: {e!r}")
+            return None
+        return Prefetched(generation, size, sample, frame, encoded, time.perf_counter() - started)
+
+    async def take(self, size: tuple[int, int] | None) -> tuple[Frame, EncodedImage] | None:
+        """The prefetched frame and its encoding if the screen still shows it, else None."""
+        if self._task is None:
+            return None
+        if self._task_key != (self.generation, size):
+            # stale, no need to wait for the capture to finish
+            self._discard()
+            return None
+        task, self._task, self._task_key = self._task, None, None
+        started = time.perf_counter()
+        prefetched = await task
+        if prefetched is None:
+            return None
+        if prefetched.generation == self.generation and prefetched.size == size:
+            sample = await self.backend.sample()
+            hit = sample is not None and changed_fraction(prefetched.sample, sample) == 0
+        else:
+            hit = False
+
+        if hit:
+            self.stats.hits += 1
+            self.stats.saved_seconds += prefetched.seconds - (time.perf_counter() - started)
+        else:
+            self.stats.misses += 1
+        return (prefetched.frame, prefetched.encoded) if hit else None
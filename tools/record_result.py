@@ -1,12 +1,25 @@
+import asyncio
 import base64
+import threading
 
 from typing import Literal
 from pathlib import Path
 
-from .base import BaseAnthropicTool, ToolResult
+from .base import BaseAnthropicTool, ToolError, ToolResult
+from .computer import OUTPUT_DIR, ComputerTool
+from .screenshot_store import get_store
 from tools.test_case_manager import update_status, VALID_STATUSES
 from tools.spreadsheet import get_url
 
+# the Sheets/Jira clients are shared module globals and are not thread-safe
+_update_lock = threading.Lock()
+
+
+def _locked_update_status(*args):
+    with _update_lock:
+        return update_status(*args)
+
+
 class RecordTestResultTool(BaseAnthropicTool):
     """
     A tool that records the results of UI test cases by accepting a test ID and status.
@@ -14,6 +27,7 @@ class RecordTestResultTool(BaseAnthropicTool):
 
     api_type: Literal["custom"] = "custom"
     name: Literal["record_test_result"] = "record_test_result"
+    parallel_safe = True
     description: str = "Record the result of a test case to database."
     input_schema: dict = {
         "type": "object",
@@ -25,18 +39,32 @@ class RecordTestResultTool(BaseAnthropicTool):
         "required": ["spreadsheet_id", "test_id", "status"],
     }
 
-    def __init__(self):
+    def __init__(self, output_dir: str = OUTPUT_DIR, computer: ComputerTool | None = None):
         super().__init__()
+        # must match the output_dir of the ComputerTool whose screenshots are evidence
+        self.output_dir = Path(output_dir)
+        self.session = computer.session if computer else self.output_dir.name
+        self.store = computer.store if computer else get_store(OUTPUT_DIR)
 
     async def __call__(self, spreadsheet_id: str, test_id: str, status: str, **kwargs) -> ToolResult:
         print(f"Recording result - Test ID: {test_id}, Status: {status}")
-        screenshot = sorted(Path("/tmp/outputs").glob("screenshot_*.png"), key=lambda p: p.stat().st_mtime)[-1]
-        print(f"Screenshot path: {screenshot}")
-        screenshot_base64 = base64.b64encode(screenshot.read_bytes()).decode()
+        screenshot_base64 = base64.b64encode(self._latest_screenshot(test_id)).decode()
         url = get_url(spreadsheet_id)
-        update_status(spreadsheet_id, test_id, status, screenshot_base64)
+        # run the blocking Sheets/Jira calls off the event loop so other agents keep going
+        await asyncio.to_thread(
+            _locked_update_status, spreadsheet_id, test_id, status, screenshot_base64
+        )
         return ToolResult(system=f"Recorded test result for {test_id} with status {status}. See {url} for details.")
 
+    def _latest_screenshot(self, test_id: str) -> bytes:
+        frame = self.store.mark_evidence(self.session, test_id)
+        if frame is None:
+            # other sessions' files in the directory are not evidence for this one
+            raise ToolError(
+                f"No screenshot of this session to attach to {test_id}, take one before recording the result"
+            )
+        return frame.png()
+
     def to_params(self) -> dict:
         return {
             "type": self.api_type,
@@ -1,8 +1,11 @@
 """Utility to run shell commands asynchronously with a timeout."""
 
 import asyncio
+from pathlib import Path
 
-TRUNCATED_MESSAGE: str = "<response clipped><NOTE>To save on context only part of this file has been shown to you. You should retry this tool after you have searched inside the file with `grep -n` in order to find the line numbers of what you are looking for.</NOTE>"
+from .capture import CLIPPED_NOTE, OutputCapture
+
+TRUNCATED_MESSAGE: str = "<response clipped>" + CLIPPED_NOTE
 MAX_RESPONSE_LEN: int = 16000
 
 
@@ -19,19 +22,33 @@ async def run(
     cmd: str,
     timeout: float | None = 120.0,  # seconds
     truncate_after: int | None = MAX_RESPONSE_LEN,
+    spill_path: str | Path | None = None,
 ):
-    """Run a shell command asynchronously with a timeout."""
+    """
+    Run a shell command asynchronously with a timeout.
+
+    At most `truncate_after` bytes of each stream are kept, half from its start and half
+    from its end. With `spill_path`, stdout that exceeds this is written there in full.
+    """
     process = await asyncio.create_subprocess_shell(
         cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
     )
+    head_bytes = truncate_after // 2 if truncate_after else None
+    tail_bytes = truncate_after - head_bytes if truncate_after else 0
+    stdout = OutputCapture(head_bytes, tail_bytes, spill_path)
+    stderr = OutputCapture(head_bytes, tail_bytes)
 
     try:
-        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
-        return (
-            process.returncode or 0,
-            maybe_truncate(stdout.decode(), truncate_after=truncate_after),
-            maybe_truncate(stderr.decode(), truncate_after=truncate_after),
+        assert process.stdout and process.stderr
+        await asyncio.wait_for(
+            asyncio.gather(
+                stdout.read_from(process.stdout),
+                stderr.read_from(process.stderr),
+                process.wait(),
+            ),
+            timeout=timeout,
         )
+        return process.returncode or 0, stdout.text(), stderr.text()
     except asyncio.TimeoutError as exc:
         try:
             process.kill()
@@ -40,3 +57,5 @@ async def run(
         raise TimeoutError(
             f"Command '{cmd}' timed out after {timeout} seconds"
         ) from exc
+    finally:
+        stdout.close()
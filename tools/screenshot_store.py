@@ -0,0 +1,170 @@
+"""
+Bounded store of the screenshots taken by each agent session.
+
+The last `memory_frames` frames of every session are kept in memory, so tools can
+look up the latest one without touching the filesystem. Frames marked as evidence
+are spilled to `root/evidence/<session>/` as compressed images when they leave the
+ring, and the files under `root` (including screenshots left there by older runs)
+are evicted once they exceed `max_age` or the store exceeds `max_disk_bytes`.
+"""
+
+import atexit
+import io
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .screen import Frame
+
+try:
+    from PIL import Image, features
+except ImportError:
+    Image = None
+
+MEMORY_FRAMES = int(os.getenv("SCREENSHOT_MEMORY_FRAMES", "5"))
+MAX_DISK_BYTES = int(os.getenv("SCREENSHOT_MAX_DISK_MB", "500")) * 2**20
+MAX_AGE = float(os.getenv("SCREENSHOT_MAX_AGE_HOURS", "72")) * 3600  # seconds
+EVICT_INTERVAL = 60.0  # seconds between age checks when nothing is spilled
+
+
+class ScreenshotStore:
+    """Per-session ring buffers of frames, with evidence spilled to disk."""
+
+    def __init__(
+        self,
+        root: str | Path,
+        memory_frames: int = MEMORY_FRAMES,
+        max_disk_bytes: int = MAX_DISK_BYTES,
+        max_age: float = MAX_AGE,
+    ):
+        self.root = Path(root)
+        self.memory_frames = memory_frames
+        self.max_disk_bytes = max_disk_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        # guards the files on disk; spills run on the spiller thread, or in flush() at exit
+        self._disk_lock = threading.RLock()
+        self._sessions: dict[str, deque[Frame]] = {}
+        # spilled files, oldest first: (path, size, mtime)
+        self._files: deque[tuple[Path, int, float]] = deque()
+        self._disk_bytes = 0
+        self._next_evict_at = time.monotonic() + EVICT_INTERVAL
+        # spills run one at a time, off the caller's thread
+        self._spiller = ThreadPoolExecutor(max_workers=1, thread_name_prefix="screenshot-spill")
+        self._spiller.submit(self._scan)
+
+    def put(self, session: str, frame: Frame):
+        """Add the newest frame of a session; evidence pushed out of the ring is spilled."""
+        with self._lock:
+            frames = self._sessions.setdefault(session, deque())
+            frames.append(frame)
+            evicted = frames.popleft() if len(frames) > self.memory_frames else None
+        if evicted is not None and evicted.evidence:
+            self._spiller.submit(self._spill, session, evicted)
+        elif time.monotonic() >= self._next_evict_at:
+            self._next_evict_at = time.monotonic() + EVICT_INTERVAL
+            self._spiller.submit(self._evict)
+
+    def latest(self, session: str) -> Frame | None:
+        with self._lock:
+            frames = self._sessions.get(session)
+            return frames[-1] if frames else None
+
+    def mark_evidence(self, session: str, label: str) -> Frame | None:
+        """Keep the latest frame of a session on disk once it leaves memory."""
+        frame = self.latest(session)
+        if frame is not None:
+            frame.evidence = label
+        return frame
+
+    def flush(self):
+        """Wait for queued spills, then spill the evidence still held in memory.
+
+        The remaining spills run in the caller's thread: at interpreter exit the spiller
+        has already been shut down and cannot take new work.
+        """
+        try:
+            self._spiller.submit(lambda: None).result()
+        except RuntimeError:
+            pass
+        with self._lock:
+            pending = [
+                (session, frame)
+                for session, frames in self._sessions.items()
+                for frame in frames
+                if frame.evidence and frame.path is None
+            ]
+        for session, frame in pending:
+            self._spill(session, frame)
+
+    def _scan(self):
+        with self._disk_lock:
+            self._scan_files()
+
+    def _scan_files(self):
+        if not self.root.exists():
+            return
+        found = []
+        for path in self.root.rglob("screenshot_*"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            found.append((path, stat.st_size, stat.st_mtime))
+        found.sort(key=lambda entry: entry[2])
+        self._files.extend(found)
+        self._disk_bytes += sum(size for _, size, _ in found)
+        self._evict()
+
+    def _spill(self, session: str, frame: Frame):
+        with self._disk_lock:
+            self._spill_frame(session, frame)
+
+    def _spill_frame(self, session: str, frame: Frame):
+        if frame.path is not None:
+            return
+        directory = self.root / "evidence" / session
+        directory.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(frame.captured_at))
+        label = "".join(c if c.isalnum() or c in "-_" else "_" for c in frame.evidence or "")
+        if Image is not None and frame.image is not None and features.check("webp"):
+            buffer = io.BytesIO()
+            frame.image.save(buffer, format="WEBP", lossless=True)
+            path, data = directory / f"screenshot_{stamp}_{label}.webp", buffer.getvalue()
+        else:
+            path, data = directory / f"screenshot_{stamp}_{label}.png", frame.png()
+        path.write_bytes(data)
+        frame.path = path
+        self._files.append((path, len(data), time.time()))
+        self._disk_bytes += len(data)
+        self._evict()
+
+    def _evict(self):
+        with self._disk_lock:
+            self._evict_files()
+
+    def _evict_files(self):
+        expired_before = time.time() - self.max_age
+        while self._files and (
+            self._files[0][2] < expired_before or self._disk_bytes > self.max_disk_bytes
+        ):
+            path, size, _ = self._files.popleft()
+            self._disk_bytes -= size
+            path.unlink(missing_ok=True)
+
+
+_stores: dict[Path, ScreenshotStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(root: str | Path) -> ScreenshotStore:
+    """The process-wide store for a screenshot directory."""
+    root = Path(root)
+    with _stores_lock:
+        if root not in _stores:
+            _stores[root] = ScreenshotStore(root)
+            atexit.register(_stores[root].flush)
+        return _stores[root]
@@ -3,6 +3,8 @@ from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from tools.tracing import traced
+
 GOOGLE_CREDS_FILE = "tools/empatika-labs-sales-20e446c8764d.json"
 
 def get_spreadsheet_services(google_creds_file: str):
@@ -59,6 +61,7 @@ def ensure_editor_access( spreadsheet_id: str, email: str):
     except HttpError as error:
         raise Exception(f"Error ensuring editor access: {str(error)}")
 
+@traced("sheets.create_spreadsheet")
 def create_spreadsheet(title: str) -> Tuple[str, Dict[str, int]]:
     """Create a new Google Spreadsheet."""
     spreadsheet = {
@@ -102,6 +105,7 @@ def make_public(spreadsheet_id: str):
     except HttpError as error:
         raise Exception(f"Error making spreadsheet public: {str(error)}")
 
+@traced("sheets.format_spreadsheet")
 def format_spreadsheet(spreadsheet_id: str, sheet_ids: Dict[str, int]):
     """Apply formatting to the spreadsheet."""
     requests = [
@@ -155,6 +159,7 @@ def format_spreadsheet(spreadsheet_id: str, sheet_ids: Dict[str, int]):
         body=body
     ).execute()
 
+@traced("sheets.populate_test_plan")
 def populate_test_plan(spreadsheet_id: str, test_plan_data: dict):
     """Populate the spreadsheet with test plan data."""
     # Populate Overview sheet
@@ -203,6 +208,7 @@ def populate_test_plan(spreadsheet_id: str, test_plan_data: dict):
         body={'values': test_case_data}
     ).execute()
 
+@traced("sheets.get_test_case_data")
 def get_test_case_data(spreadsheet_id: str, range: str = 'Test Cases!A:J') -> List[List]:
     """
     Get test case data from the spreadsheet.
@@ -221,6 +227,7 @@ def get_test_case_data(spreadsheet_id: str, range: str = 'Test Cases!A:J') -> Li
     ).execute()
     return result.get('values', [])
 
+@traced("sheets.update_cell")
 def update_cell(spreadsheet_id: str, range: str, value: str):
     """
     Update a single cell in the spreadsheet.
@@ -238,6 +245,7 @@ def update_cell(spreadsheet_id: str, range: str, value: str):
         body={'values': [[value]]}
     ).execute()
 
+@traced("sheets.update_cell_color")
 def update_cell_color(spreadsheet_id: str, sheet_id: int, row: int, col: int, color: Dict):
     """
     Update the background color of a cell.
@@ -273,6 +281,7 @@ def update_cell_color(spreadsheet_id: str, sheet_id: int, row: int, col: int, co
         body={'requests': [request]}
     ).execute()
 
+@traced("sheets.get_sheet_ids")
 def get_sheet_ids(spreadsheet_id: str) -> Dict[str, int]:
     """
     Get sheet IDs for the spreadsheet.
@@ -304,6 +313,7 @@ def get_url(spreadsheet_id: str) -> str:
     """
     return f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit"
 
+@traced("sheets.batch_update_cells")
 def batch_update_cells(spreadsheet_id: str, updates: List[Dict[str, List]]):
     """
     Update multiple cells in batch.
@@ -323,6 +333,7 @@ def batch_update_cells(spreadsheet_id: str, updates: List[Dict[str, List]]):
         body=body
     ).execute()
 
+@traced("sheets.batch_update_formatting")
 def batch_update_formatting(spreadsheet_id: str, requests: List[Dict]):
     """
     Apply multiple formatting updates in batch.
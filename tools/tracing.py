@@ -0,0 +1,162 @@
+"""
+Span-based tracing of where the time in a test plan goes.
+
+Spans are attributed to the test case that is current in the calling context, are
+appended to a JSONL file when `TRACE_JSONL` is set, and are aggregated into
+Prometheus-style counters that can be served over HTTP on `TRACE_METRICS_PORT`.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+
+_test_case: ContextVar[str | None] = ContextVar("test_case", default=None)
+_parent: ContextVar[str | None] = ContextVar("parent_span", default=None)
+
+
+@dataclass
+class Span:
+    name: str
+    start: float
+    test_case: str | None
+    parent: str | None
+    attributes: dict[str, Any] = field(default_factory=dict)
+    duration: float = 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration * 1000, 3),
+            "test_case": self.test_case,
+            "parent": self.parent,
+            **self.attributes,
+        }
+
+
+class JsonlExporter:
+    """Appends one JSON object per finished span to a file."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def __call__(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str) + "\n"
+        with self._lock, self.path.open("a") as file:
+            file.write(line)
+
+
+class Tracer:
+    """Collects spans, hands them to exporters and keeps per-span-name aggregates."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._exporters: list[Callable[[Span], None]] = []
+        self._counts: dict[tuple[str, str], int] = defaultdict(int)
+        self._seconds: dict[tuple[str, str], float] = defaultdict(float)
+
+    def add_exporter(self, exporter: Callable[[Span], None]):
+        self._exporters.append(exporter)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """Time the enclosed block; attributes can be added to the yielded span."""
+        span = Span(
+            name=name,
+            start=time.time(),
+            test_case=_test_case.get(),
+            parent=_parent.get(),
+            attributes=attributes,
+        )
+        token = _parent.set(name)
+        started = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - started
+            _parent.reset(token)
+            self._finish(span)
+
+    def traced(self, name: str) -> Callable:
+        """Decorator that wraps every call of a function in a span."""
+
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def _finish(self, span: Span):
+        key = (span.name, span.test_case or "")
+        with self._lock:
+            self._counts[key] += 1
+            self._seconds[key] += span.duration
+        for exporter in self._exporters:
+            exporter(span)
+
+    def render_prometheus(self) -> str:
+        """Render the span aggregates in the Prometheus text exposition format."""
+        lines = [
+            "# HELP phaedrus_span_seconds Time spent in traced operations.",
+            "# TYPE phaedrus_span_seconds summary",
+        ]
+        with self._lock:
+            for (name, test_case), count in sorted(self._counts.items()):
+                labels = f'span="{name}",test_case="{test_case}"'
+                lines.append(f"phaedrus_span_seconds_count{{{labels}}} {count}")
+                lines.append(
+                    f"phaedrus_span_seconds_sum{{{labels}}} {self._seconds[(name, test_case)]:.6f}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def serve_metrics(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Serve `render_prometheus` on http://<host>:<port>/metrics from a daemon thread."""
+        tracer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = tracer.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def set_test_case(test_case_id: str | None):
+    """Attribute spans started from the current context to the given test case."""
+    _test_case.set(test_case_id)
+
+
+tracer = Tracer()
+span = tracer.span
+traced = tracer.traced
+
+if trace_path := os.getenv("TRACE_JSONL"):
+    tracer.add_exporter(JsonlExporter(trace_path))
+if metrics_port := os.getenv("TRACE_METRICS_PORT"):
+    # local only unless TRACE_METRICS_HOST opens it up, e.g. 0.0.0.0 for a scraper
+    tracer.serve_metrics(int(metrics_port), os.getenv("TRACE_METRICS_HOST", "127.0.0.1"))
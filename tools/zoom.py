@@ -0,0 +1,53 @@
+from typing import Literal
+
+from .base import BaseAnthropicTool, ToolError, ToolResult
+from .computer import ComputerTool
+
+
+class ComputerZoomTool(BaseAnthropicTool):
+    """
+    A tool that shows the agent one region of the screen at the display's resolution,
+    to read text that is too small in the scaled-down screenshots.
+    """
+
+    api_type: Literal["custom"] = "custom"
+    name: Literal["computer_zoom"] = "computer_zoom"
+    description: str = (
+        "Zoom into a region of the screen and get it at full native resolution, e.g. to read "
+        "small text or check an icon before recording a result. The region is "
+        "[x0, y0, x1, y1] in the same coordinate space as the computer tool's screenshots. "
+        "Keep the region small: a region with more native pixels than a full screenshot is "
+        "rejected. On high-DPI screens the image may be scaled down to that size."
+    )
+    input_schema: dict = {
+        "type": "object",
+        "properties": {
+            "region": {
+                "type": "array",
+                "items": {"type": "integer"},
+                "minItems": 4,
+                "maxItems": 4,
+                "description": "Top-left and bottom-right corners: [x0, y0, x1, y1].",
+            }
+        },
+        "required": ["region"],
+    }
+
+    def __init__(self, computer: ComputerTool):
+        super().__init__()
+        self.computer = computer
+
+    async def __call__(self, region: list[int] | None = None, **kwargs) -> ToolResult:
+        if not isinstance(region, list) or len(region) != 4:
+            raise ToolError(f"{region} must be a list of 4 ints")
+        if not all(isinstance(i, int) and i >= 0 for i in region):
+            raise ToolError(f"{region} must be a list of non-negative ints")
+        return await self.computer.zoom(tuple(region))
+
+    def to_params(self) -> dict:
+        return {
+            "type": self.api_type,
+            "name": self.name,
+            "description": self.description,
+            "input_schema": self.input_schema,
+        }